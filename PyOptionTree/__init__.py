@@ -1,2 +1,2 @@
-from pyoptiontree import PyOptionTree
+from pyoptiontree import PyOptionTree, PyOptionStruct, OTOuterProduct
 from pyoptiontreeexceptions import *
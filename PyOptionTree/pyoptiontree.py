@@ -1,18 +1,36 @@
 import random, inspect, time, cPickle
 from pyoptiontreeexceptions import *
 from operator import itemgetter
-import base64
-import os, os.path
+from bisect import bisect_left, bisect_right
+from array import array
+import base64, re, string
+import os, os.path, stat
+import weakref, threading
 
 try:
     from hashlib import md5
 except ImportError:
     from md5 import md5
 
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
 OPTTREE_RANDALPHALENGTH  = 10
 OPTTREE_MAXRECURSIONDEPTH = 32
 OPTTREE_TRUNCATEDERRORSTRINGLENGTH = 60
 OPTTREE_TARGETPRINTLINELENGTH = 50
+OPTTREE_VERSION = '0.21'
+OPTTREE_CACHEFORMAT = 3
+OPTTREE_STREAMINGFILESIZE = 1 << 26
+OPTTREE_STREAMINGBLOCKSIZE = 1 << 20
+OPTTREE_NAMECACHESIZE = 4096
 OTdebug = False
 
 ######################################################################
@@ -29,30 +47,68 @@ def OTRandTag():
 
 OPTTREE_NONNONEXISTANTQUERY = '__' + OTRandTag()
 
+def OTCompileFileWorker(args):
+    # Compiles an option file in a worker process for the parallel
+    # parsing; None means the file should be parsed the normal way,
+    # which also reports any error.
+    filename, userfuncnames, cachedir = args
+    try:
+        # Only the names of the user functions are needed to compile
+        ot = PyOptionTree(userfunclist=[(n, OTCompileFileWorker) for n in userfuncnames],
+                          cachedir=cachedir)
+        return ot._PyOptionTree__CompileFile(filename)
+    except Exception:
+        return None
+
+# Argument names of the functions in the type tables, by function;
+# the methods of every tree share the same function.  Weakly keyed so
+# user functions made for one tree aren't kept after it's gone.
+OTargnames = weakref.WeakKeyDictionary()
+
+def OTArgNames(function):
+    key = getattr(function, 'im_func', function)
+    try:
+        return OTargnames[key]
+    except KeyError:
+        names = OTargnames[key] = frozenset(inspect.getargspec(function)[0])
+        return names
+    except TypeError:
+        # Not hashable, or can't be weakly referenced
+        return frozenset(inspect.getargspec(function)[0])
+
 def OTIsNameChar(s):
     return s.isalnum() or s == '[' or s == ']' or s == '_' or s == '/' or s == '.'
 
 def OTIsNumberChar(s):
     return s.isdigit() or s == '.' or s == 'e' or s == 'E' or s == '-'
 
-class OTTypeInfo:
+class OTTypeInfo(object):
     """
     Helps with parsing the option tree file; used internally.
     """
-
-    def __init__(self, matchkey, endmarker, getvalue, description, matchlength=-1):
+    __slots__ = ('matchfunc', 'matchlength', 'firstchars', 'endmarker', 'getvalue',
+                 'description', 'argnames', 'passname')
+
+    def __init__(self, matchkey, endmarker, getvalue, description, matchlength=-1, firstchars=None):
+        # If matchkey is a function, it is called with the string and
+        # the start and end of the range to test.  firstchars gives
+        # the characters such a match can start with; None means any.
+        # getvalue returns the value in its compiled form and must not
+        # touch the tree; __MakeValue turns it into the real value.
+        
         if isinstance(matchkey, basestring):
             if matchkey[-1].isalnum():
-                self.matchfunc = lambda s: (s.startswith(matchkey) and
-                                            (len(s) <= len(matchkey) or not s[len(matchkey)].isalnum()))
+                self.matchfunc = lambda s, p, e: (s.startswith(matchkey, p, e) and
+                                                  (e <= p + len(matchkey) or not s[p + len(matchkey)].isalnum()))
             else:
-                self.matchfunc = lambda s: s.startswith(matchkey)
+                self.matchfunc = lambda s, p, e: s.startswith(matchkey, p, e)
                 
             if matchlength == -1:
                 self.matchlength = len(matchkey)
             else:
                 self.matchlength = matchlength
 
+            self.firstchars = matchkey[0]
         else:
             self.matchfunc = matchkey
             if matchlength == -1:
@@ -60,22 +116,34 @@ class OTTypeInfo:
             else:
                 self.matchlength = matchlength
 
+            self.firstchars = firstchars
+
         self.endmarker = endmarker
         self.getvalue = getvalue
         self.description = description
-        self.passname = ('name' in inspect.getargspec(getvalue)[0])
+        self.argnames = OTArgNames(getvalue)
+        self.passname = ('name' in self.argnames)
 
-    def Matches(self, s):
-        return self.matchfunc(s)
+    def Matches(self, s, pos, end):
+        return self.matchfunc(s, pos, end)
+
+# The arguments a function in the type tables can take, by name
+OTFuncCallArgs = ('branch', 'loc', 'rawvaluelist', 'valuelist', 'name', 'readyfunc')
 
 class OTFuncInfo(OTTypeInfo):
     """
     Helps with parsing the option tree file, used internally.
     """
-    def __init__(self, *args):
+    __slots__ = ('isuserfunc', 'pure', 'name', 'evalimmediately', 'callargs')
+
+    def __init__(self, *args, **kwargs):
         
         self.isuserfunc = False #Overridden if OTUserFunc is used
 
+        # True if the result depends only on the arguments, so it can
+        # be replaced by its value when they're constant
+        self.pure = kwargs.get('pure', False)
+
         self.name = args[0]
         function = args[1]
 
@@ -96,48 +164,278 @@ class OTFuncInfo(OTTypeInfo):
             
         OTTypeInfo.__init__(self, self.name + '(', ')', function, description)
 
+        # Those of OTFuncCallArgs the function takes, worked out once
+        # rather than on each call; None if it's given the values
+        # in the list instead, as a user function is
+        self.callargs = tuple([a for a in OTFuncCallArgs if a in self.argnames])
+
 class OTUserFunc(OTFuncInfo):
     """
     What holds information about a user function, used internally.
     """
+    __slots__ = ()
 
     def __init__(self, *args):
         OTFuncInfo.__init__(self, *args)
         self.isuserfunc = True
+        self.callargs = None
+        self.pure = bool(getattr(self.getvalue, 'pure', False))
                     
-class OTSearchFunc:
+class OTSearchFunc(object):
+    # matchfunc is called with the string and the position to test
+    __slots__ = ('matchfunc', 'matchlength')
+
     def __init__(self, matchfunc, matchlength):
         self.matchfunc = matchfunc
         self.matchlength = matchlength
 
-class OTChInfo:
+class OTChInfo(object):
     """
     Keeps track of information important to error parsing; used internally
     """
-    def __init__(self, ch, line, column):
-        self.ch = ch
+    __slots__ = ('line', 'column')
+
+    def __init__(self, line, column):
         self.line = line
         self.column = column
 
-# These are for linking stuff up
-class LinkupBase:
+class OTLocIndex(object):
+    """
+    Maps positions in a parse buffer back to lines and columns in the
+    original source; used internally for error reporting.  Behaves
+    like a list of OTChInfo, one per buffer character, but stores only
+    the line start offsets of the source and the offsets where the
+    buffer and the source stop lining up.  The OTChInfo are created on
+    demand.  It also holds the escaped characters of the buffer, which
+    stand in it as a placeholder.
+    """
+    __slots__ = ('linestarts', 'segstarts', 'segsrc', 'segfixed', 'cutstarts', 'cutshifts',
+                 'escpos', 'escchars', 'lineoffset', 'endpos', 'endloc', 'start', 'stop')
+
+    def __init__(self, base=None):
+        if base == None:
+            self.linestarts = array('l', [0])  # source offsets of each line
+            self.segstarts  = array('l')       # buffer offsets of each segment
+            self.segsrc     = array('l')       # source offsets of each segment
+            self.segfixed   = array('b')       # True if the segment is a tag for one source char
+            self.cutstarts  = array('l', [0])  # buffer offsets of each removed range
+            self.cutshifts  = array('l', [0])  # total length removed up to that point
+            self.escpos     = array('l')       # buffer offsets of escaped characters
+            self.escchars   = array('c')       # the escaped characters
+            self.lineoffset = 0                # lines in the source before this part
+            self.endpos = 0
+            self.endloc = None
+            self.start = 0
+            self.stop = 0
+        else:
+            for a in OTLocIndex.__slots__:
+                setattr(self, a, getattr(base, a))
+
+    def addSegment(self, bufpos, srcpos, fixed):
+        self.segstarts.append(bufpos)
+        self.segsrc.append(srcpos)
+        self.segfixed.append(fixed)
+
+    def addLine(self, srcpos):
+        self.linestarts.append(srcpos)
+
+    def addEscape(self, bufpos, ch):
+        self.escpos.append(bufpos)
+        self.escchars.append(ch)
+
+    def finish(self, endpos, buflen, srclen):
+        # Everything from endpos on is the tag after the last source character
+        self.endpos = endpos
+        self.endloc = OTChInfo(len(self.linestarts) + self.lineoffset, srclen - self.linestarts[-1])
+        self.stop = buflen
+
+    def removeRanges(self, ranges):
+        # ranges must be sorted and not overlap
+        removed = self.cutshifts[-1]
+        for rl, rr in ranges:
+            self.cutstarts.append(rl - removed)
+            removed += rr - rl
+            self.cutshifts.append(removed)
+            self.stop -= rr - rl
+
+        # Drop the escaped characters in the ranges and move the rest
+        escpos, escchars = array('l'), array('c')
+        removed, i = 0, 0
+        for p, ch in zip(self.escpos, self.escchars):
+            while i < len(ranges) and ranges[i][1] <= p:
+                removed += ranges[i][1] - ranges[i][0]
+                i += 1
+            if i == len(ranges) or p < ranges[i][0]:
+                escpos.append(p - removed)
+                escchars.append(ch)
+        self.escpos, self.escchars = escpos, escchars
+
+    def restoreEscapes(self, chstr, a, b):
+        # Returns chstr[a:b] with the escaped characters put back
+        a, b = self.start + a, self.start + b
+        i = bisect_left(self.escpos, a)
+        j = bisect_left(self.escpos, b)
+
+        if i == j:
+            return chstr[a:b]
+
+        sl = []
+        for k in xrange(i, j):
+            sl += [chstr[a:self.escpos[k]], self.escchars[k]]
+            a = self.escpos[k] + 1
+        sl.append(chstr[a:b])
+
+        return ''.join(sl)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            start, stop, step = i.indices(len(self))
+            v = OTLocIndex(self)
+            v.start = self.start + start
+            v.stop = self.start + max(start, stop)
+            return v
+
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('location index out of range')
+
+        p = self.start + i
+        p += self.cutshifts[bisect_right(self.cutstarts, p) - 1]
+
+        if p >= self.endpos:
+            return self.endloc
+
+        k = bisect_right(self.segstarts, p) - 1
+        if self.segfixed[k]:
+            src = self.segsrc[k]
+        else:
+            src = self.segsrc[k] + p - self.segstarts[k]
+
+        line = bisect_right(self.linestarts, src)
+        return OTChInfo(line + self.lineoffset, src - self.linestarts[line-1] + 1)
+
+    def srcpos(self, i):
+        # Offset in the source where buffer character i starts, or
+        # None for the tag after the last source character
+        p = self.start + i
+        e = bisect_left(self.escpos, p)
+        escaped = (e < len(self.escpos) and self.escpos[e] == p)
+        p += self.cutshifts[bisect_right(self.cutstarts, p) - 1]
+
+        if p >= self.endpos:
+            return None
+
+        k = bisect_right(self.segstarts, p) - 1
+        if self.segfixed[k]:
+            return self.segsrc[k] - escaped
+        else:
+            return self.segsrc[k] + p - self.segstarts[k]
+
+class OTNameCache(object):
+    """
+    Holds the names parsed into paths, shared between trees; used
+    internally.  Names are dropped once size others have been added
+    without them being used again, so it's close to least recently
+    used without any bookkeeping on a hit.
+    """
+    __slots__ = ('size', 'recent', 'old', 'hits', 'misses')
+
+    def __init__(self, size):
+        self.size = size
+        self.recent = {}
+        self.old = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        if name in self.recent:
+            self.hits += 1
+            return self.recent[name]
+        elif name in self.old:
+            # Moved back to recent the way a new name is added, so
+            # recent never holds more than size names
+            self.hits += 1
+            l = self.old[name]
+            self.add(name, l)
+            return l
+        else:
+            self.misses += 1
+            return None
+
+    def add(self, name, l):
+        if len(self.recent) >= self.size:
+            self.old, self.recent = self.recent, {}
+        self.recent[name] = l
+
+    def clear(self):
+        self.recent, self.old = {}, {}
+        self.hits = self.misses = 0
+
+# These are for linking stuff up.  There are one or more of these for
+# every link and expression in a tree, so the attributes subclasses
+# use are slots; any other keyword given goes in a __dict__, which is
+# only made if one is.
+class LinkupBase(object):
+    __slots__ = ('string', 'loc', 'origsource', '__dict__')
+
     def __init__(self, string, loc, origsource, **kwargs):
         self.string = string
         self.loc = loc
         self.origsource = origsource
-        self.__dict__.update(kwargs)
+        for k, v in kwargs.iteritems():
+            setattr(self, k, v)
+
+    def __getstate__(self):
+        d = dict(getattr(self, '__dict__', {}))
+        for c in type(self).__mro__:
+            for n in c.__dict__.get('__slots__', ()):
+                if n != '__dict__' and hasattr(self, n):
+                    d[n] = getattr(self, n)
+        return d
+
+    def __setstate__(self, d):
+        for k, v in d.iteritems():
+            setattr(self, k, v)
 
 class OTSoftLink(LinkupBase):
-    pass
+    __slots__ = ('path',)   # string parsed by __Name2NameList, once it's been followed
+
+    def __init__(self, string, loc, origsource, **kwargs):
+        self.path = None
+        LinkupBase.__init__(self, string, loc, origsource, **kwargs)
 
 class OTEvalStatement(LinkupBase):
-    pass
+    # code, constvars and linkvars are set the first time the
+    # statement is evaluated: string compiled, and sldict split into
+    # the variables that are plain values, readied, and those
+    # retrieved each time
+    __slots__ = ('sldict', 'origstring', 'code', 'constvars', 'linkvars')
+
+    def __init__(self, string, loc, origsource, **kwargs):
+        self.code = self.constvars = self.linkvars = None
+        LinkupBase.__init__(self, string, loc, origsource, **kwargs)
+
+    def __getstate__(self):
+        # Code objects can't be pickled
+        d = LinkupBase.__getstate__(self)
+        d.pop('code', None)
+        return d
+
+    def __setstate__(self, d):
+        self.code = self.constvars = self.linkvars = None
+        LinkupBase.__setstate__(self, d)
 
 
 ######################################################################
 # Define a function to evaluate
 
-class OTFunctionEval:
+class OTFunctionEval(object):
+    __slots__ = ('branch', 'funcinfo', 'loc', 'rawvaluelist', 'name')
+
     def __init__(self, branch, funcinfo, loc, rawvaluelist, name):
         self.branch = branch
         self.funcinfo = funcinfo
@@ -145,8 +443,147 @@ class OTFunctionEval:
         self.rawvaluelist = rawvaluelist
         self.name = name
 
+class OTOuterProduct(object):
+    """
+    The sequence of trees given by outer_product().  It can be used
+    like a list of them, with len(), indexing, slicing and iteration,
+    but each tree is made only when it's first asked for, as a copy of
+    the template sharing all but the fields set in it.  A slice is
+    another OTOuterProduct sharing the trees made so far.
+
+    The trees are numbered with the last field changing fastest: tree
+    i has value i % n of the last field's n values, and the fields
+    before it are numbered in the same way by i // n.  combination(i)
+    gives the (field, value) pairs set in tree i.  A tree is made from
+    the template as it is when the tree is first asked for.
+    """
+    __slots__ = ('fields', 'values', 'makeitem', 'made', 'start', 'step', 'length')
+
+    def __init__(self, fields, values, makeitem, made=None, start=0, step=1, length=None):
+        # makeitem(n, combination) makes tree n of the whole product
+        self.fields = fields
+        self.values = values
+        self.makeitem = makeitem
+        self.made = (made, {})[made == None]
+        self.start = start
+        self.step = step
+
+        if length == None:
+            length = 1
+            for v in values:
+                length *= len(v)
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            return OTOuterProduct(self.fields, self.values, self.makeitem, self.made,
+                                  self.start + start*self.step, self.step*step,
+                                  len(xrange(start, stop, step)))
+
+        n = self.__Position(i)
+        if n not in self.made:
+            self.made[n] = self.makeitem(n, self.__Combination(n))
+        return self.made[n]
+
+    def __iter__(self):
+        for i in xrange(self.length):
+            yield self[i]
+
+    def __repr__(self):
+        return ('<outer_product of ' + ', '.join(self.fields) + ': '
+                + str(self.length) + ' trees>')
+
+    def combination(self, i):
+        """
+        Returns the list of (field, value) pairs set in tree i.
+        """
+        return self.__Combination(self.__Position(i))
+
+    def shard(self, k, n):
+        """
+        Returns shard k of n, counting from 0, as an OTOuterProduct.
+        Tree i goes to shard i % n, so the shards differ in size by at
+        most one and between them hold every tree once; the trees
+        keep their order.
+        """
+        if not isinstance(k, (int, long)) or not isinstance(n, (int, long)):
+            raise TypeError('outer_product shards must be given as integers')
+        if n < 1 or k < 0 or k >= n:
+            raise ValueError('there is no shard ' + str(k) + ' of ' + str(n))
+        return self[k::n]
+
+    def __Position(self, i):
+        # Position in the whole product of the i-th tree here
+        if not isinstance(i, (int, long)):
+            raise TypeError('outer_product indices must be integers')
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError('outer_product index out of range')
+        return self.start + i*self.step
+
+    def __Combination(self, n):
+        l = []
+        for f, v in reversed(zip(self.fields, self.values)):
+            n, k = divmod(n, len(v))
+            l.append((f, v[k]))
+        l.reverse()
+        return l
+
+class OTDependencies(object):
+    """
+    Records the keys read while resolving a value for the resolution
+    cache; used internally.
+    """
+    __slots__ = ('keys', 'modified')
+
+    def __init__(self):
+        # (id(branch), key) -> (branch, key); key None means the whole branch
+        self.keys = {}
+        self.modified = False
+
+class OTResolving(threading.local):
+    """
+    The OTDependencies of the values being resolved, kept for each
+    thread so a get() in one thread doesn't record what another reads;
+    used internally.
+    """
+    def __init__(self):
+        self.stack = []
+
+######################################################################
+# Compiled values; what an option file is stored as in the cache.  A
+# file is a list of (name, value, (line, column)) statements, the
+# values stored as parsed except for the following, and locations as
+# (line, column) pairs instead of OTChInfo to keep loading fast.
+# Branches and functions, the values that can fail when made, also
+# keep where they were parsed from and as what, for error messages.
+
+class OTCompiledBranch:
+    def __init__(self, statements, context = None):
+        self.statements = statements
+        self.context = context
+
+class OTCompiledEval:
+    def __init__(self, string, loc, varlist, origstring):
+        self.string = string
+        self.loc = loc
+        self.varlist = varlist
+        self.origstring = origstring
+
+class OTCompiledFunction:
+    def __init__(self, funcname, loc, rawvaluelist, context = None):
+        self.funcname = funcname
+        self.loc = loc
+        self.rawvaluelist = rawvaluelist
+        self.context = context
+
 
-class PyOptionTree:
+class PyOptionTree(object):
     """
     PyOptionTree Description
     =================================================================
@@ -620,6 +1057,10 @@ class PyOptionTree:
         Bar[2] = {a = 2; b = 3; c = 12 }
         Bar[3] = {a = 2; b = 4; c = 12 }
 
+      The list is an OTOuterProduct, which makes each tree only when
+      it's first read, so large sweeps can be given without making
+      every combination.  The last field changes fastest, as above.
+
     unpickle(arg1,...), unpickle_string(arg1,...)
       unpickle() loads a python object from a pickle file and returns
       it.  unpickle_string(arg1, ...) is identical except that it
@@ -683,6 +1124,14 @@ class PyOptionTree:
     """
 
 
+    # A tree is made of many of these, one per branch, so what each
+    # holds is kept in slots; __dict__ is left in so other attributes
+    # can still be set, but is only made if one is.
+    __slots__ = ('__opts', '__cilist', '__chstr', '__nestmaps', '__setvarrank', '__cachedir',
+                 '__parseprocesses', '__resolved', '__dependents', '__parent', '__root',
+                 '__depth', '__path', '__treename', '__sources', '__types', '__typeindex',
+                 '__typeindexdefault', '__userfunclist', '__cow', '__copies', '__dict__', '__weakref__')
+
     # This is where all the parsing definitions are defined.
     __newlinetag = '__NL__' + OTRandTag()
     
@@ -705,11 +1154,25 @@ class PyOptionTree:
         ('\"','\"',True),
         ('\'','\'',True)]
 
+    __nestopeners = dict(((sc, (ec, im)) for sc, ec, im in __nestchars))
+    __nestscan = re.compile('|'.join(re.escape(t) for t in
+                                     sorted(set(t for sc, ec, im in __nestchars for t in (sc, ec)),
+                                            key=len, reverse=True)))
+
+    # Start tags the comment eliminator looks for, mapped to their end
+    # tags and whether everything in between is cut out
+    __skiptags = dict(((sc, (ec, False)) for sc, ec, im in __nestchars if im))
+    __skiptags.update(((sc, (ec, True)) for sc, ec in __commenttags))
+    __skipscan = re.compile('|'.join(re.escape(ts) for ts in sorted(__skiptags, key=len, reverse=True)))
+
     __escapechar = '\\'
-    __escaped_chars = {}
-    __escaped_tag_prefix = '_EC_'
+    __escapeornewline = re.compile(re.escape(__escapechar) + '(.?)|\n', re.DOTALL)
+    __escapedplaceholder = '_'
     __listsepchar = ','
     __equalchar   = '='
+    __resolvingstacks = OTResolving()
+    __resolving = property(lambda self: self.__resolvingstacks.stack)   # This thread's OTDependencies
+    __namecache = OTNameCache(OPTTREE_NAMECACHESIZE)
 
     def __init__(self, arg = None, userfunclist=[], **kwargs):
         """
@@ -720,7 +1183,11 @@ class PyOptionTree:
         attempts to load the file name specified. If arg is a list,
         then it treats the list as a set of command line parameters
         (see addCommandLineArgs(...) for options; the lookforfiles
-        parameter can be set by name here, e.g. lookforfiles=False)
+        and lookforselect parameters can be set by name here,
+        e.g. lookforselect=True)
+        A cache directory for option files may be given as cachedir
+        and the number of processes to parse them with as
+        parseprocesses; see setCacheDir() and setParseProcesses().
         
         userfunclist is a list of user defined functions which is
         passed to addUserFunctions() before any parsing is done.  See
@@ -733,32 +1200,40 @@ class PyOptionTree:
         self.__opts = {}
         self.__cilist= []
         self.__chstr = []
+        self.__nestmaps = []
         self.__setvarrank = 0
+        self.__cachedir = None
+        self.__parseprocesses = 1
+        self.__resolved = {}
+        self.__dependents = {}
+        self.__cow = None               # See __CopyLazily()
+        self.__copies = None
 
         # Test to see if we're a branch of a parent tree
         if 'parent' in kwargs:  
-            self.__parent = kwargs['parent']
+            self.__SetParent(kwargs['parent'], kwargs['treename'])
             self.__types = None             # Found by going to root
             self.__userfunclist = self.__parent.__userfunclist
-            self.__treename = kwargs['treename']
             self.__sources = self.__parent.__sources
             self.__RecordSource(kwargs['treesource'])
         elif isinstance(arg, PyOptionTree):
             copyot = arg.copy()
             self.__opts = copyot.__opts()
-            self.__parent = copyot.__parent
-            self.__treename = copyot.__treename
+            self.__SetParent(copyot.__parent, copyot.__treename)
             self.__sources = copyot.__sources
             self.__cilist = copyot.__cilist
             self.__chstr = copyot.__chstr
+            self.__nestmaps = copyot.__nestmaps
             self.__types = copyot.__types
+            self.__typeindex = copyot.__typeindex
+            self.__typeindexdefault = copyot.__typeindexdefault
             self.__userfunclist = copyot.__userfunclist
+            self.__cachedir = arg.__CacheDir()
+            self.__parseprocesses = arg.__ParseProcesses()
             if userfunclist != []:
                 self.addUserFunctions(userfunclist)
         else:
-            self.__treename = '/'
-            self.__sources = []
-            self.__parent = None
+            self.__SetParent(None, '/')
             self.__sources = []
 
             if userfunclist != []:
@@ -768,8 +1243,14 @@ class PyOptionTree:
 
             self.__CreateTypeTable()
 
+            if 'cachedir' in kwargs:
+                self.setCacheDir(kwargs['cachedir'])
+            if 'parseprocesses' in kwargs:
+                self.setParseProcesses(kwargs['parseprocesses'])
+
             if type(arg) == list:
-                self.addCommandLineArgs(arg)
+                self.addCommandLineArgs(arg, **dict([(k, kwargs[k]) for k in ('lookforfiles', 'lookforselect')
+                                                     if k in kwargs]))
 
             if isinstance(arg, basestring):
                 self.addOptionsFile(arg)
@@ -803,12 +1284,60 @@ class PyOptionTree:
                 os.chdir(cwd)
                 
             elif type(infile) == file:
-                self.addString(''.join([s.replace('\n', ' \n') for s in infile.readlines()]),
-                               sourcename = (sourcename, infile.name)[sourcename == ''])
+                sourcename = (sourcename, infile.name)[sourcename == '']
+
+                pos = self.__StreamStart(infile)
+                if pos != None:
+                    self.__AddStreamedFile(infile, sourcename, pos)
+                    return
+                
+                content = self.__ReadOptionsFile(infile)
+                
+                if self.__CacheDir() == None:
+                    self.addString(content, sourcename = sourcename)
+                else:
+                    self.__AddCachedString(content, sourcename)
         except PyOptionTreeException, ote:
             raise ote                      
         
-    def addCommandLineArgs(self, arglist, lookforfiles=True):
+    def setCacheDir(self, cachedir):
+        """
+        Turns on caching of the option files loaded into the tree
+        through addOptionsFile(), optfile(), or -f on the command line.
+        Each file is stored, parsed, in the directory cachedir (created
+        if needed), and later loads of a file with the same contents
+        read that instead of parsing it again.  Functions normally run
+        while parsing, such as copy() and optfile(), are still run
+        when the file is loaded.  Entries are keyed on the file contents,
+        the version of PyOptionTree, and the names of the user
+        functions; an entry that can't be read is simply rebuilt.
+        If cachedir is None, caching is turned off.
+        """
+
+        if self.__parent != None:
+            self.root().setCacheDir(cachedir)
+        elif cachedir == None:
+            self.__cachedir = None
+        else:
+            self.__cachedir = os.path.abspath(os.path.expanduser(cachedir))
+
+    def setParseProcesses(self, processes):
+        """
+        Sets the number of processes used to parse option files when
+        several are loaded at once, i.e. by optfile() or by -f on the
+        command line.  The files are parsed side by side and then
+        added to the tree one after the other in the order given, so
+        the result is the same as loading them in turn.  If processes
+        is None, one process per CPU is used; if it is 1 (the
+        default), the files are parsed in this process.
+        """
+
+        if self.__parent != None:
+            self.root().setParseProcesses(processes)
+        else:
+            self.__parseprocesses = processes
+
+    def addCommandLineArgs(self, arglist, lookforfiles=True, lookforselect=False):
         """
         Takes a list of parameters given on the command line, usually
         sys.argv[1:], and adds them, in order, to the option tree,
@@ -831,6 +1360,18 @@ class PyOptionTree:
           --MyOption=<newvalue>
 
         on the command line.
+
+        If lookforselect is True (default False, so --select=<value>
+        still sets an option named select), --select <name>:<i> or
+        --select=<name>:<i> keeps only tree i of the outer_product() at
+        name, and --select <name>:<k>/<n> keeps only shard k of n; see
+        select().  These are done after all the files and options are
+        added, so for an array job on a cluster, a program calling
+        addCommandLineArgs(sys.argv[1:], lookforselect=True) and run as::
+
+          myjob -f sweep.opt --select sweep:$SLURM_ARRAY_TASK_ID/16
+
+        makes only the trees of that task's shard.
         
         """
 
@@ -854,6 +1395,14 @@ class PyOptionTree:
                     ol += [('f', curnum+1, a[1])]
                     curnum += 2
                     del a[:2]
+                elif lookforselect and a[0] == '--select':
+                    ol += [('s', curnum+1, a[1])]
+                    curnum += 2
+                    del a[:2]
+                elif lookforselect and a[0].startswith('--select='):
+                    ol += [('s', curnum, a[0][len('--select='):])]
+                    curnum += 1
+                    del a[:1]
                 elif lookforfiles and (a[0].startswith('-f') or a[0].startswith('--file')):
                     pos = a[0].find('=')
                     if pos == -1:
@@ -884,9 +1433,11 @@ class PyOptionTree:
             raise PyOptionTreeParseError('Parsing Command Line Options', 'Expected parameter at end.')
 
         try:
+            compiled = self.__CompileFiles([s for command, n, s in ol if command == 'f'])
+
             for command, n, s in ol:
                 if command == 'f':
-                    self.addOptionsFile(s)
+                    self.__AddCompiledFile(s, '', compiled.pop(0))
                 elif command == 'c':
                     if type(n) == tuple:
                         source = '<Command line args ' + str(n[0]) + '-' + str(n[1]) + '>'
@@ -899,8 +1450,34 @@ class PyOptionTree:
                         self.addString(s[1:], sourcename = source)
                     else:
                         self.addString(s, sourcename = source)
+
+            for command, n, s in ol:
+                if command == 's':
+                    self.__SelectFromArg(s, n)
         except PyOptionTreeException, ote:
             raise ote
+
+    def __SelectFromArg(self, s, n):
+        # --select <name>:<i> or <name>:<k>/<n>
+        pos = s.rfind(':')
+        try:
+            if pos == -1:
+                raise ValueError
+            name, spec = s[:pos], s[pos+1:]
+            if spec.find('/') == -1:
+                index, shard = int(spec), None
+            else:
+                index, shard = None, tuple([int(e) for e in spec.split('/')])
+                if len(shard) != 2:
+                    raise ValueError
+        except ValueError:
+            raise PyOptionTreeParseError('Parsing Command Line Options',
+                                         '\"--select ' + s + '\" not understood; give <name>:<i> or <name>:<k>/<n>.')
+
+        try:
+            self.select(name, index, shard)
+        except PyOptionTreeException, ote:
+            raise ote.PrependMessage('<Command line arg ' + str(n) + '>')
         
             
     def addString(self, s, sourcename = ''):
@@ -913,64 +1490,221 @@ class PyOptionTree:
         if sourcename == '':
             sourcename = '<string input>'
 
-        cilist = []
+        (chstr, cilist) = self.__TranslateInput(s)
+        chstr = self.__EliminateComments(chstr, cilist)
+
+        # Now process the list
+        try:
+            self.__ParseCharList(chstr, cilist, sourcename)
+        except PyOptionTreeException, ote:
+            raise ote
         
-        linenum, colnum = 1, 0
-        escapeflag = False
-
-        # Translate newline characters and escaped characters
-        for c in s:
-            colnum += 1
-            if escapeflag:
-                cilist += [OTChInfo(cc, linenum, colnum) for cc in self.__NewEscapedCharTag(c)]
-                escapeflag = False
-            elif c == self.__escapechar:
-                escapeflag = True
-            elif c == '\n':
-                cilist += [OTChInfo(cc, linenum, colnum) for cc in self.__newlinetag]
-                linenum += 1
-                colnum = 0
-            else:
-                cilist += [OTChInfo(c, linenum, colnum)]
+    def __ReadOptionsFile(self, infile):
+        return ''.join([s.replace('\n', ' \n') for s in infile.readlines()])
+
+    def __StreamStart(self, infile):
+        # Where to stream infile from if it's big enough to go through
+        # __AddStreamedFile, or None.  Only regular files can be memory
+        # mapped; pipes and the like are read as they are.
+        if OPTTREE_STREAMINGFILESIZE == None or mmap == None:
+            return None
 
-        cilist += [OTChInfo(cc, linenum, colnum) for cc in self.__newlinetag]
+        try:
+            st = os.fstat(infile.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            pos = infile.tell()
+        except (IOError, OSError):
+            return None
 
-        chstr = ''.join([ci.ch for ci in cilist])
+        size = st.st_size - pos
+        if size > 0 and size >= OPTTREE_STREAMINGFILESIZE:
+            return pos
+        else:
+            return None
 
-        elimstack = []
+    def __AddStreamedFile(self, infile, sourcename, pos):
+        # Parses the rest of infile from a memory map, a block of
+        # lines at a time, so only the statements being parsed are
+        # held in memory.  What's left of the last statement in a
+        # block is carried over to the next, as is a block ending
+        # inside a comment or a nested value; the block size doubles
+        # until such a statement fits.  The carried text keeps its
+        # line and column numbers.
 
-        # Eliminate all the comments, skipping immune nest chars
+        m = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
 
-        searchpairs = ([(sc, (ec, False)) for sc,ec,t in filter(lambda (sc,ec,im): im, self.__nestchars)]
-                       +[(sc, (ec, True)) for sc,ec in self.__commenttags])
-        
+        try:
+            self.__RecordSource(sourcename)
 
-        ps = 0
-        while ps < len(chstr):
-            changemade = False
-
-            for ts, (te, cutout) in searchpairs:
-                if chstr[ps:].startswith(ts):
-                    pe = chstr[ps + len(ts):].find(te)
-                    if pe == -1:
-                        raise PyOptionTreeParseError(self.__LocString(cilist[ps:], action = 'Removing Comments'),
-                                                     '\'' + ts + '\' missing end tag \'' + te + '\'')
-                    if cutout: elimstack += [(ps, ps + pe + len(ts) + len(te))]
-                    ps += pe + len(ts) + len(te)
-                    changemade = True
-
-            if not changemade: ps += 1
+            pending = ''
+            lineoffset = 0
+            blocksize = OPTTREE_STREAMINGBLOCKSIZE
+            
+            while True:
+                end = m.find('\n', min(pos + blocksize, len(m)))
+                end = (end + 1, len(m))[end == -1]
+                pending += m[pos:end].replace('\n', ' \n')
+                pos = end
+                final = (pos == len(m))
+
+                (chstr, cilist) = self.__TranslateInput(pending, lineoffset)
+
+                if final:
+                    self.__ParseCharList(self.__EliminateComments(chstr, cilist), cilist, None)
+                    break
+
+                try:
+                    chstr = self.__EliminateComments(chstr, cilist)
+                except PyOptionTreeParseError:
+                    blocksize *= 2
+                    continue
                 
-        #self.__dbprint('\n\n\n\n######################### Eliminating!')
-        for es, ee in sorted(elimstack, reverse=True):
-            #self.__dbprint(''.join([ci.ch for ci in cilist[es:ee]]))
-            cilist[es:ee] = []
+                nestmap = self.__NestMap(chstr)
+                if len(nestmap) != 0 and max(nestmap) > len(chstr):
+                    blocksize *= 2
+                    continue
 
-        # Now process the list
+                rl = self.__ParseCharList(chstr, cilist, None, nestmap = nestmap, partial = True)
+                
+                src = (None, cilist.srcpos(rl))[rl < len(cilist)]
+                if src == None:
+                    lineoffset += pending.count('\n')
+                    pending = ''
+                else:
+                    # Blank out the part of the line already parsed
+                    ls = pending.rfind('\n', 0, src) + 1
+                    lineoffset += pending.count('\n', 0, ls)
+                    pending = ' '*(src - ls) + pending[src:]
+                
+                blocksize = OPTTREE_STREAMINGBLOCKSIZE
+        finally:
+            m.close()
+
+    def __CompileFiles(self, filenames):
+        # Compiles the files in parallel if set up to; the list
+        # returned has the statements for each file, or None where
+        # __AddCompiledFile should just load the file.
+        processes = self.__ParseProcesses()
+
+        if processes == None and multiprocessing != None:
+            processes = multiprocessing.cpu_count()
+
+        if processes == 1 or len(filenames) < 2 or multiprocessing == None:
+            return [None]*len(filenames)
+
+        tasks = [(os.path.abspath(f), [l[0] for l in self.__userfunclist], self.__CacheDir())
+                 for f in filenames]
         try:
-            self.__ParseCharList(''.join([ci.ch for ci in cilist]), cilist, sourcename)
-        except PyOptionTreeException, ote:
-            raise ote
+            pool = multiprocessing.Pool(min(processes, len(tasks)))
+            try:
+                return pool.map(OTCompileFileWorker, tasks)
+            finally:
+                pool.terminate()
+        except (OSError, AssertionError):
+            # E.g. no pool allowed in a daemon process
+            return [None]*len(filenames)
+
+    def __AddCompiledFile(self, infile, sourcename, statements):
+        # Adds the file the way addOptionsFile(infile, sourcename)
+        # does, given what __CompileFiles returned for it.
+        if statements == None:
+            self.addOptionsFile(infile, sourcename)
+            return
+
+        cwd = os.path.abspath(os.getcwd())
+        
+        d, f = os.path.split(infile)
+        if len(d) != 0:  os.chdir(os.path.join(cwd, d))
+
+        try:
+            self.__ExecuteStatements(statements, (sourcename, f)[sourcename == ''])
+        finally:
+            os.chdir(cwd)
+
+    def __CompileFile(self, filename):
+        # The statements in the file, read from the cache if there;
+        # None for a file that should be streamed instead.
+        infile = open(filename, 'r')
+        if self.__StreamStart(infile) != None:
+            infile.close()
+            return None
+        
+        s = self.__ReadOptionsFile(infile)
+        infile.close()
+
+        if self.__CacheDir() == None:
+            return self.__CompileString(s)
+
+        key = self.__CacheKey(s)
+        cachefile = os.path.join(self.__CacheDir(), key + '.otc')
+
+        statements = self.__LoadCompiled(cachefile, key)
+
+        if statements == None:
+            statements = self.__CompileString(s)
+            self.__SaveCompiled(cachefile, key, statements)
+
+        return statements
+
+    def __CacheKey(self, s):
+        return md5('\n'.join([OPTTREE_VERSION, str(OPTTREE_CACHEFORMAT)]
+                             + [l[0] for l in self.__userfunclist] + [s])).hexdigest()
+
+    def __AddCachedString(self, s, sourcename):
+        # Like addString(s, sourcename), but goes through the cache
+        key = self.__CacheKey(s)
+        filename = os.path.join(self.__CacheDir(), key + '.otc')
+
+        statements = self.__LoadCompiled(filename, key)
+
+        if statements != None:
+            self.__ExecuteStatements(statements, sourcename)
+        else:
+            # Saved first; an error setting the statements depends on
+            # the tree, not the file
+            statements = self.__CompileString(s, sourcename)
+            self.__SaveCompiled(filename, key, statements)
+            self.__ExecuteStatements(statements, None)
+
+    def __LoadCompiled(self, filename, key):
+        # Returns None if the entry is missing, stale, or unreadable
+        try:
+            f = open(filename, 'rb')
+        except IOError:
+            return None
+
+        try:
+            try:
+                header, statements = cPickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            return None
+
+        if header != ('PyOptionTree', OPTTREE_CACHEFORMAT, key):
+            return None
+        
+        return statements
+
+    def __SaveCompiled(self, filename, key, statements):
+        # Written to a temporary file and renamed so a partly written
+        # entry is never read; failing to write the cache isn't an error.
+        d = os.path.dirname(filename)
+        tmpname = filename + '.' + OTRandTag()
+
+        try:
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            f = open(tmpname, 'wb')
+            try:
+                cPickle.dump((('PyOptionTree', OPTTREE_CACHEFORMAT, key), statements), f, 2)
+            finally:
+                f.close()
+            os.rename(tmpname, filename)
+        except (IOError, OSError, cPickle.PicklingError):
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
         
     def get(self, name, default=OPTTREE_NONNONEXISTANTQUERY, vardict={}, recursionsleft=OPTTREE_MAXRECURSIONDEPTH):
         """
@@ -988,13 +1722,37 @@ class PyOptionTree:
         tree when ``get()`` is called from a subtree is possible with
         a \'/\' prefix, and moving from a subtree to a parent tree is
         possible using \'..\'.
+
+        Values retrieved without a ``vardict`` are cached, so links,
+        expressions and functions are only evaluated again once one of
+        the keys they depend on is changed through the tree (e.g. by
+        ``set()``, ``update()``, or adding more input).  Lists, tuples
+        and dictionaries are copied each time, but any other objects
+        returned are shared between calls, and changing the contents
+        of a value in place is not seen by the cache.
+
+        A chain of links, however long, is followed in one step, and
+        links that lead back to themselves raise an error naming the
+        keys in the cycle.
         """
 
         required = (default == OPTTREE_NONNONEXISTANTQUERY)
 
-        if recursionsleft == 0:
+        if recursionsleft <= 0:
             raise PyOptionTreeRetrievalError(self.__LocString(), 'Maximum Recursion Depth Exceeded.')
 
+        if not vardict and recursionsleft == OPTTREE_MAXRECURSIONDEPTH and isinstance(name, basestring):
+            try:
+                v = self.__ResolveCached(name, required)
+            except PyOptionTreeException, ote:
+                raise ote.PrependMessage(self.__LocString(action='Resolving key \"' + name + '\"'))
+
+            if v is not OPTTREE_NONNONEXISTANTQUERY:
+                return v
+
+            # Otherwise it failed; resolving it again below puts the
+            # default in the same place as it always has
+
         try:
             return self.__GetValue(name, default, required, vardict, recursionsleft)
         except PyOptionTreeException, ote:
@@ -1010,6 +1768,95 @@ class PyOptionTree:
 
         return self.get(name,default,vardict)
 
+    def getMany(self, names, defaults={}, asdict=False):
+        """
+        Returns the values of all the keys in ``names``, as a tuple in
+        the same order, or as a dictionary keyed by name if ``asdict``
+        is True.  ``defaults`` is a dictionary giving the default for
+        any of the names that may be missing; each value is otherwise
+        the same as ``get(name)`` or ``get(name, default)`` returns.
+
+        This is faster than calling ``get()`` for each name, as the
+        branches on the way to the keys are looked up once for all the
+        names under them.
+        """
+
+        branches = {}
+        values = []
+
+        for name in names:
+            v = self.__GetUnderBranches(name, branches)
+            if v is OPTTREE_NONNONEXISTANTQUERY:
+                v = self.get(name, defaults.get(name, OPTTREE_NONNONEXISTANTQUERY))
+            values.append(v)
+
+        if asdict:
+            return dict(zip(names, values))
+        else:
+            return tuple(values)
+
+    def accessor(self, name, default=OPTTREE_NONNONEXISTANTQUERY):
+        """
+        Returns a function taking no arguments that does the same as
+        ``get(name, default)``, but faster, for options read many
+        times.  Once the value has been resolved, calling the function
+        returns it straight from the cache kept by ``get()``; if the
+        tree is changed in a way that affects the value, the next call
+        resolves it again.  An error in ``name`` itself is raised
+        here.
+        """
+
+        self.__Name2NameList(name)
+        resolved = self.__resolved
+
+        def getvalue():
+            if name in resolved and not self.__resolving:
+                v, deps, ok = resolved[name]
+                if ok:
+                    return self.__CopyContainers(v)
+
+            return self.get(name, default)
+
+        return getvalue
+
+    def select(self, name, index=None, shard=None):
+        """
+        Keeps only some of the trees of the outer_product() at name:
+        tree index, or, with shard=(k, n), shard k of n, in which tree
+        i goes to shard i % n (see OTOuterProduct.shard()).  name then
+        holds an OTOuterProduct of only those trees, and links to name
+        see only them; they keep their numbers in the full product,
+        e.g. sweep[12].  Only the trees kept are ever made, so this
+        takes the same time however large the product is.  Returns a
+        reference to the option tree.
+        """
+
+        loc = self.__LocString(action='Selecting from \"' + name + '\"')
+
+        if (index == None) == (shard == None):
+            raise PyOptionTreeRetrievalError(loc, 'Give either an index or a shard.')
+
+        try:
+            v = self.get(name)
+        except PyOptionTreeException, ote:
+            raise ote.PrependMessage(loc)
+
+        if not isinstance(v, OTOuterProduct):
+            raise PyOptionTreeRetrievalError(loc, 'Value is not an outer_product().')
+
+        try:
+            if index != None:
+                v[index]
+                index = (index, index + len(v))[index < 0]
+                v = v[index:index+1]
+            else:
+                v = v.shard(*shard)
+        except (IndexError, TypeError, ValueError), e:
+            raise PyOptionTreeRetrievalError(loc, str(e))
+
+        self.set(name, v)
+        return self
+
     def isValid(self, name, vardict = {}):
         """
         Returns True if name exists and is valid (no errors) and False
@@ -1051,12 +1898,14 @@ class PyOptionTree:
         and input sources on the path from the root to this node.
         """
         
-        if self.parent() != None:
-            s = self.parent().description() + '/'
-        else:
-            s = '/'
+        l = []
+        b = self
+        while b != None:
+            l.append(b.fullTreeName())
+            b = b.__parent
 
-        return s + self.fullTreeName()
+        l.reverse()
+        return '/' + '/'.join(l)
 
         
     def treeName(self):
@@ -1080,10 +1929,7 @@ class PyOptionTree:
         Returns the root tree.
         """
 
-        if self.__parent == None:
-            return self
-        else:
-            return self.__parent.root()
+        return self.__root
             
 
     def parent(self):
@@ -1099,10 +1945,7 @@ class PyOptionTree:
         this one, starting with '/'.
         """
         
-        if self.parent() == None:
-            return ['/']
-        else:
-            return self.parent().pathFromRoot() + [self.treeName()]
+        return list(self.__path)
 
     def nameFromRoot(self):
         """
@@ -1117,6 +1960,9 @@ class PyOptionTree:
         parameters and branches in the local tree.
         """
 
+        if self.__resolving:
+            self.__RecordRead(None)
+        self.__CopyEntries()
         return [(n, self.__ReadyValue(v)) for n, (v, o) in self.__opts.items()]
     
 
@@ -1125,6 +1971,9 @@ class PyOptionTree:
         Returns a list of the names of all the items in the local tree.
         """
 
+        if self.__resolving:
+            self.__RecordRead(None)
+        self.__CopyEntries()
         return [n for n, (v, o) in self.__opts.items()]
 
     def leaves(self):
@@ -1133,6 +1982,9 @@ class PyOptionTree:
         parameters in the tree, excluding branches.
         """
 
+        if self.__resolving:
+            self.__RecordRead(None)
+        self.__CopyEntries()
         return [(n, v) for n,v in
                 filter(lambda (n,v): not isinstance(v, PyOptionTree),
                        [(n,self.__ReadyValue(v)) for n,(v,o) in self.__opts.items()])]
@@ -1151,6 +2003,9 @@ class PyOptionTree:
         in the tree.
         """
 
+        if self.__resolving:
+            self.__RecordRead(None)
+        self.__CopyEntries()
         return [(n, v) for n,v in
                 filter(lambda (n,v): isinstance(v, PyOptionTree),
                        [(n,self.__ReadyValue(v)) for n,(v,o) in self.__opts.items()])]
@@ -1194,7 +2049,7 @@ class PyOptionTree:
 
         """
         
-        self.__userfuncs = userfunclist + self.__userfuncs        
+        self.__userfunclist = list(userfunclist) + self.__userfunclist
         self.__CreateTypeTable()
 
     def copy(self):
@@ -1202,16 +2057,18 @@ class PyOptionTree:
         Returns a copy of the tree.  If the tree has a parent, the
         copy would share the same parent and name as the original, but
         all name resolutions from the original node ignore this one.
+
+        The copy shares what's in the original until either of them
+        is changed, so making it takes the same time however large the
+        tree is; each part of the tree is copied over as it's first
+        looked at.
         """
 
-        ot = PyOptionTree(None, userfunclist = self.__userfunclist)
-        ot.__parent = self.parent()
-        ot.__treename = self.__treename
+        ot = PyOptionTree(None)
+        ot.__ShareTypeTable(self)
+        ot.__SetParent(self.parent(), self.__treename)
         ot.__sources = self.__sources
-        ot.__opts = {}
-        for k, (v, r) in self.__opts.items():
-            #self.__dbprint('COPY>  Copying key=' + str(k) + '  v=' + str(v) + '   r=' + str(r) + '\n\n')
-            ot.__SetValue(k, ot.__CopyIn(self, v, k, rerefsl = False), r)
+        ot.__CopyLazily(self, -1, False, self.__sources)
 
         return ot
 
@@ -1305,27 +2162,70 @@ class PyOptionTree:
 
         # return base64.b64encode(md5(self.string()).digest()).replace('/', '').replace('+', '')[:8]
 
-        mhash = md5()
+        # Branches are hashed before the trees holding them, from a
+        # stack rather than by recursing, so deep trees can be hashed.
+        # hashes holds (tree, hash) by id; the tree is kept so its id
+        # isn't reused.
+        hashes = {}
+        onstack = {}
+        stack = []
+
+        def findbranches(v, l):
+            if type(v) == list or type(v) == tuple or isinstance(v, OTOuterProduct):
+                for ve in v: findbranches(ve, l)
+            elif type(v) == dict:
+                for k, ve in v.items():
+                    findbranches(k, l)
+                    findbranches(ve, l)
+            elif isinstance(v, PyOptionTree):
+                l.append(v)
 
-        def updatehash(v):
-            if type(v) == list or type(v) == tuple:
-                for ve in v: updatehash(ve)
+        def push(ot):
+            items = ot.items()
+            l = []
+            for n, v in items:
+                if isinstance(v, PyOptionTree):
+                    l.append(v)
+                elif (type(v) == list or type(v) == tuple or type(v) == dict
+                      or isinstance(v, OTOuterProduct)):
+                    findbranches(v, l)
+            onstack[id(ot)] = True
+            stack.append((ot, items, iter(l)))
+
+        def updatehash(mhash, v):
+            if type(v) == list or type(v) == tuple or isinstance(v, OTOuterProduct):
+                for ve in v: updatehash(mhash, ve)
             elif type(v) == dict:
                 for k, ve in v.items():
-                    updatehash(k)
-                    updatehash(ve)
+                    updatehash(mhash, k)
+                    updatehash(mhash, ve)
             elif isinstance(v, basestring):
                 mhash.update(v)
             elif type(v) == float or type(v) == int:
                 mhash.update(str(v))
             elif isinstance(v, PyOptionTree):
-                mhash.update(v.strhash())
+                mhash.update(hashes[id(v)][1])
             else:
                 mhash.update(cPickle.dumps(v))
 
-        updatehash(self.items())
+        push(self)
+        while stack != []:
+            ot, items, branches = stack[-1]
+            for b in branches:
+                if id(b) not in hashes:
+                    if id(b) in onstack:
+                        raise PyOptionTreeRetrievalError(ot.__LocString(action='Hashing Tree'),
+                                                         'Branch \"' + (b.nameFromRoot(), '/')[b.parent() == None] + '\" contains itself.')
+                    push(b)
+                    break
+            else:
+                stack.pop()
+                del onstack[id(ot)]
+                mhash = md5()
+                updatehash(mhash, items)
+                hashes[id(ot)] = (ot, base64.b64encode(mhash.digest()).replace('/', '').replace('+', '')[:8])
 
-        return base64.b64encode(mhash.digest()).replace('/', '').replace('+', '')[:8]
+        return hashes[id(self)][1]
 
     def __eq__(self, ot):
         """
@@ -1351,13 +2251,71 @@ class PyOptionTree:
 
         return self
 
+    def foldConstants(self):
+        """
+        Replaces the expressions and function calls in the tree, and
+        its branches, whose values can't depend on anything but
+        constants with those values, and returns how many were
+        replaced.  Nothing else changes, so ``get()`` returns the same
+        as before without evaluating them.
+
+        An expression is constant if it uses only its $() variables and
+        they are constant.  A function call is constant if the function
+        is one of dict, add, cat, sum, rep, range, or seqrep, or a user
+        function with a true ``pure`` attribute, and its arguments are
+        constant.  Numbers, strings, None, and lists, tuples or
+        dictionaries of them are constant, as are links to keys holding
+        a constant.  Note that a link is followed only once, so a
+        replaced value doesn't change if the key it linked to is set
+        afterwards, and that saving the tree saves the value.
+        """
+
+        return self.__FoldBranch({})
+
+    def freeze(self):
+        """
+        Returns a PyOptionStruct holding the values of the tree, with
+        every link, expression, and function resolved once.  Branches
+        become PyOptionStructs, lists become tuples, and dictionaries
+        become PyOptionStructs too, so the result can't be changed;
+        it can be read from several threads at once and pickled.
+        Nothing refers back to the tree, so later changes to it don't
+        show up in the result.  Any error resolving a value is raised
+        here.
+
+        For example, with ``s = ot.freeze()``, ``s.b.x``, ``s['b']['x']``
+        and ``s['b/x']`` all give ``ot.get('b/x')``.
+        """
+
+        frozen, todo = {}, []
+        fs = self.__Freeze(self, frozen, todo)
+        while todo != []:
+            ot, ts = todo.pop()
+            dict.update(ts, [(n, self.__Freeze(e, frozen, todo)) for n, e in ot.items()])
+        return fs
+
     def size(self):
         """
         Returns the number of variables and branches in this node of the tree.
         """
         
+        if self.__resolving:
+            self.__RecordRead(None)
+        self.__CopyEntries()
         return len(self.__opts)
-    
+
+    def nameCacheStats(self):
+        """
+        Returns a dictionary with the number of hits and misses of
+        the cache of parsed names (e.g. 'a/b[2]') used by ``get()``,
+        ``set()`` and links, and its current and maximum size.  The
+        cache is shared by all trees.
+        """
+
+        nc = self.__namecache
+        return {'hits' : nc.hits, 'misses' : nc.misses,
+                'size' : len(nc.recent) + len(nc.old), 'maxsize' : 2*nc.size}
+
 
     ######################################################################
     #  Automatic Python Functions
@@ -1385,48 +2343,85 @@ class PyOptionTree:
     ######################################################################
     # Lookup tables for the parsing; initialized and deleted as needed to minimize storage requirements
     
+    # The table of built in types, made the first time a tree is
+    # created and shared by all of them after that; see
+    # __CreateTypeTable()
+    __builtintypes = None
+
     def __CreateTypeTable(self):
+        # Trees without user functions all use the built in table as
+        # is; one with them gets a table of its own with them put in
+        # before the types they would otherwise conflict with.
+
+        if PyOptionTree.__builtintypes == None:
+            PyOptionTree.__builtintypes = PyOptionTree.__new__(PyOptionTree).__MakeBuiltinTypes()
+
+        types, nfirst, index, indexdefault = PyOptionTree.__builtintypes
+
+        if self.__userfunclist == []:
+            self.__types = types
+            self.__typeindex = index
+            self.__typeindexdefault = indexdefault
+        else:
+            self.__types = (types[:nfirst] + [OTUserFunc(*list(l)) for l in self.__userfunclist]
+                            + types[nfirst:])
+            self.__typeindex, self.__typeindexdefault = self.__IndexTypes(self.__types)
+
+    def __ShareTypeTable(self, ot):
+        # Parse with the same types as ot, without making them again
+        b = ot
+        while b.__types == None:
+            b = b.__parent
+        self.__userfunclist = ot.__userfunclist
+        self.__types = b.__types
+        self.__typeindex = b.__typeindex
+        self.__typeindexdefault = b.__typeindexdefault
+
+    def __MakeBuiltinTypes(self):
 
         ########################################
 
         # Type matching.  Tests in order of insertion; put most
         # frequent first for precedence Also note that these functions
         # are passed a branch pointer indicating which branch they
-        # should use, so the 'self' is irrelevant.
+        # should use, so the 'self' is irrelevant; it's an empty tree
+        # made only to hold them.
 
         # Those labeled with OTTypeInfo are primitive types;
 
-        notname = OTSearchFunc(lambda s: not OTIsNameChar(s[0:1]), 0)
-        notnum  = OTSearchFunc(lambda s: not OTIsNumberChar(s[0:1]), 0)
+        notname = OTSearchFunc(lambda s, p: not OTIsNameChar(s[p:p+1]), 0)
+        notnum  = OTSearchFunc(lambda s, p: not OTIsNumberChar(s[p:p+1]), 0)
         
-        self.__types = [
-            OTTypeInfo(lambda sh: sh[0].isdigit(), notnum, self.__Function_Number, 'Numeric',matchlength=0),
-            OTTypeInfo('[',     ']',     self.__Function_List,     'List'),
-            OTTypeInfo('(',     ')',     self.__Function_Tuple,    'Tuple'),
-            OTTypeInfo('{',     '}',     self.__Function_Branch,   'Branch'),
+        types = [
+            OTTypeInfo(lambda s, p, e: s[p].isdigit(), notnum, self.__Function_Number, 'Numeric',
+                       matchlength=0, firstchars=string.digits),
+            OTTypeInfo('[',     ']',     self.__Compile_List,      'List'),
+            OTTypeInfo('(',     ')',     self.__Compile_Tuple,     'Tuple'),
+            OTTypeInfo('{',     '}',     self.__Compile_Branch,    'Branch'),
             OTTypeInfo('\'',    '\'',    self.__Function_String,   'String'),
             OTTypeInfo('\"',    '\"',    self.__Function_String,   'String'),
-            OTTypeInfo('..',    notname, self.__Function_SoftLink, 'SoftLink',matchlength=0),
-            OTTypeInfo('./',    notname, self.__Function_SoftLink, 'SoftLink',matchlength=0),
-            OTTypeInfo('/',     notname, self.__Function_SoftLink, 'SoftLink',matchlength=0),
-            OTTypeInfo('@(',    ')',     self.__Function_Eval,     'Evaluation Code'),
-            OTTypeInfo('eval(', ')',     self.__Function_Eval,     'Evaluation Code'),
+            OTTypeInfo('..',    notname, self.__Compile_SoftLink,  'SoftLink',matchlength=0),
+            OTTypeInfo('./',    notname, self.__Compile_SoftLink,  'SoftLink',matchlength=0),
+            OTTypeInfo('/',     notname, self.__Compile_SoftLink,  'SoftLink',matchlength=0),
+            OTTypeInfo('@(',    ')',     self.__Compile_Eval,      'Evaluation Code'),
+            OTTypeInfo('eval(', ')',     self.__Compile_Eval,      'Evaluation Code'),
             OTTypeInfo('-',     notnum,  self.__Function_Number,   'Numeric',matchlength=0),
             OTTypeInfo('.',     notnum,  self.__Function_Number,   'Numeric',matchlength=0),
-            OTTypeInfo('_',     notname, self.__Function_SoftLink, 'SoftLink',matchlength=0),
+            OTTypeInfo('_',     notname, self.__Compile_SoftLink,  'SoftLink',matchlength=0),
             OTTypeInfo(';',     '',      self.__Function_None,     'Null Value'),
 
             # Append the functions; i.e. those that take a list of primitive types as their argument
-            OTFuncInfo('dict',           self.__Function_Dict,     'Create Dictionary from list of tuples.'),
-            OTFuncInfo('add',            self.__Function_CatList,  'Concatenation (+) List'),
-            OTFuncInfo('cat',            self.__Function_CatList,  'Concatenation (+) List'),
-            OTFuncInfo('sum',            self.__Function_CatList,  'Concatenation (+) List'),
-            OTFuncInfo('rep',            self.__Function_Rep,      'String Replacement Function'),
+            OTFuncInfo('dict',           self.__Function_Dict,     'Create Dictionary from list of tuples.', pure=True),
+            OTFuncInfo('add',            self.__Function_CatList,  'Concatenation (+) List', pure=True),
+            OTFuncInfo('cat',            self.__Function_CatList,  'Concatenation (+) List', pure=True),
+            OTFuncInfo('sum',            self.__Function_CatList,  'Concatenation (+) List', pure=True),
+            OTFuncInfo('rep',            self.__Function_Rep,      'String Replacement Function', pure=True),
             OTFuncInfo('optfile',        self.__Function_OptFile,  'Option Tree File', True),
             OTFuncInfo('copy',           self.__Function_Copy,     'Copy Item', True), 
             OTFuncInfo('reref',          self.__Function_ReRef,    'Copy Item (rereferenced)', True),
-            OTFuncInfo('range',          self.__Function_Range,    'Creates sequence list (similar to range() in python)'),
-            OTFuncInfo('seqrep',         self.__Function_SeqRep,   'Sequence Element Replacer'),
+            OTFuncInfo('range',          self.__Function_Range,    'Creates sequence list (similar to range() in python)',
+                       pure=True),
+            OTFuncInfo('seqrep',         self.__Function_SeqRep,   'Sequence Element Replacer', pure=True),
             OTFuncInfo('outer_product',  self.__Function_OuterProduct,'Expands option tree based on list fields'),
             OTFuncInfo('timestamp',      self.__Function_TimeStamp,'Create Time Stamp (python time.strftime())', True),
             OTFuncInfo('strftime',       self.__Function_TimeStamp,'Create Time Stamp (python time.strftime())', True),
@@ -1434,13 +2429,12 @@ class PyOptionTree:
             OTFuncInfo('unpickle',       self.__Function_Unpickle, 'Unpickles an object from a pickle file'),
             OTFuncInfo('unpickle_string',self.__Function_Unpickle_string, 'Unpickles an object from a string')]
 
-        
-        # Append the user defined functions
-        for l in self.__userfunclist:
-            self.__types.append(OTUserFunc(*list(l)) )
+
+        # The user defined functions go here, in a tree's own table
+        nfirst = len(types)
 
         # These conflict with the more specific ones above; thus need to go at the end
-        self.__types += [
+        types += [
             OTTypeInfo('None',  '',      self.__Function_None,     'Null Value'),
             OTTypeInfo('True',  '',      self.__Function_TrueBool, 'Bool Value'),
             OTTypeInfo('true',  '',      self.__Function_TrueBool, 'Bool Value'),
@@ -1450,7 +2444,34 @@ class PyOptionTree:
             OTTypeInfo('false', '',      self.__Function_FalseBool,'Bool Value'),
             OTTypeInfo('No',    '',      self.__Function_FalseBool,'Bool Value'),
             OTTypeInfo('no',    '',      self.__Function_FalseBool,'Bool Value'),
-            OTTypeInfo(lambda sh: sh[0].isalpha(), notname, self.__Function_SoftLink, 'SoftLink',matchlength=0)]
+            OTTypeInfo(lambda s, p, e: s[p].isalpha(), notname, self.__Compile_SoftLink, 'SoftLink',matchlength=0)]
+
+        index, indexdefault = self.__IndexTypes(types)
+        return (types, nfirst, index, indexdefault)
+
+    def __IndexTypes(self, types):
+        # Index the table by first character; each entry lists the
+        # types that could match a value starting with that character,
+        # in the order of the table.  Returns the index and the list
+        # for characters not in it.
+        chars = set()
+        for t in types:
+            if t.firstchars != None:
+                chars.update(t.firstchars)
+
+        index = dict([(ch, []) for ch in chars])
+        indexdefault = []
+
+        for t in types:
+            if t.firstchars == None:
+                indexdefault.append(t)
+                for l in index.itervalues():
+                    l.append(t)
+            else:
+                for ch in t.firstchars:
+                    index[ch].append(t)
+
+        return (index, indexdefault)
     
     ######################################################################
     #   Helper functions for setting things
@@ -1482,7 +2503,16 @@ class PyOptionTree:
             if rank == None:
                 rank = self.__setvarrank
                 self.__setvarrank += 1
-            self.__opts[name] = (value, rank)
+
+            b = self
+            while b != None:
+                if b.__copies != None:
+                    self.__SeparateCopies()
+                    break
+                b = b.__parent
+
+            self.__opts[name] = (value, rank)
+            self.__Invalidate(name)
         return value
                  
     def __GetOrCreateBranch(self, namelist):
@@ -1490,29 +2520,28 @@ class PyOptionTree:
         if isinstance(namelist, basestring):
             namelist = self.__Name2NameList(namelist)
 
-        if namelist == []:
-            return self
-        elif namelist[0] == '/':
-            return self.root().__GetOrCreateBranch(namelist[1:])
-        elif namelist[0] == '..':
-            if self.__parent == None:
-                raise PyOptionTreeParseError(self.__LocString(action='Walking Tree'), 'No parent to resolve \'' + '..' +'\' to.')
-            return self.__parent.__GetOrCreateBranch(namelist[1:])
-        else:
-            if namelist[0] not in self.__opts:
-                return self.__SetValue(self.__NameList2Name([namelist[0]]),
-                                       self.__NewBranch(self.__NameList2Name([namelist[0]])).__GetOrCreateBranch(namelist[1:]))
+        b = self
+        for n in namelist:
+            if n == '/':
+                b = b.__root
+            elif n == '..':
+                if b.__parent == None:
+                    raise PyOptionTreeParseError(b.__LocString(action='Walking Tree'), 'No parent to resolve \'' + '..' +'\' to.')
+                b = b.__parent
+            elif not b.__HasKey(n):
+                b = b.__SetValue(b.__NameList2Name([n]), b.__NewBranch(b.__NameList2Name([n])))
             else:
                 try:
-                    v = self.get(self.__NameList2Name(namelist[0]))
+                    v = b.get(b.__NameList2Name(n))
                 except PyOptionTreeException, ote:
-                    raise ote.PrependMessage(self.__LocString(action='Walking Tree (Branch \"' + self.__NameList2Name([namelist[0]]) + '\"' ))
+                    raise ote.PrependMessage(b.__LocString(action='Walking Tree (Branch \"' + b.__NameList2Name([n]) + '\"' ))
 
                 if isinstance(v, PyOptionTree):
-                    return v.__GetOrCreateBranch(namelist[1:])
+                    b = v
                 else:
-                    raise PyOptionTreeParseError(self.__LocString(action='Creating Branch'),
-                                               'Name \"' + self.__NameList2Name([namelist[0]]) + '\" already declared as a non-branch item.')
+                    raise PyOptionTreeParseError(b.__LocString(action='Creating Branch'),
+                                               'Name \"' + b.__NameList2Name([n]) + '\" already declared as a non-branch item.')
+        return b
 
     def __CreateNewBranch(self, name):
         if isinstance(name, basestring):
@@ -1525,6 +2554,20 @@ class PyOptionTree:
         #self.__dbprint('NEWBRANCH> treename ' + name)
         return PyOptionTree(isbranch=True, parent = self, treename = name, treesource = self.__CurSource())
 
+    def __SetParent(self, parent, treename):
+        # The root, depth and path from the root are kept on each
+        # branch so they don't have to be found by walking up the tree
+        self.__parent = parent
+        self.__treename = treename
+        if parent == None:
+            self.__root = self
+            self.__depth = 0
+            self.__path = ('/',)
+        else:
+            self.__root = parent.__root
+            self.__depth = parent.__depth + 1
+            self.__path = parent.__path + (treename,)
+
     ######################################################################
     #   Helper functions for finding and retrieving stuff
 
@@ -1535,23 +2578,27 @@ class PyOptionTree:
         if isinstance(name, basestring):
             name = self.__Name2NameList(name)
 
+        b = self
+        i = 0
         if name[0] == '/':
-            return self.root().__GetValue(name[1:], default, required, vardict, recursionsleft, readyvalue)
-        else:
-            v = self.__RetrieveLocalValue(name[0], default, required, vardict, recursionsleft, readyvalue)
+            b = self.__root
+            i = 1
+
+        last = len(name) - 1
+        while True:
+            v = b.__RetrieveLocalValue(name[i], default, required, vardict, recursionsleft, readyvalue)
             
-            if len(name) == 1:  
+            if i == last:
                 # If we're at the end; get the value; if we're not, pass it on
                 return v
+            elif isinstance(v, PyOptionTree):
+                b = v
+                i += 1
+            elif not required:
+                return default
             else:
-                if isinstance(v, PyOptionTree):
-                    return v.__GetValue(name[1:], default, required, vardict, recursionsleft, readyvalue)
-                else:
-                    if not required:
-                        return default
-                    else:
-                        raise PyOptionTreeRetrievalError(self.__LocString(action='Retrieving Value'),
-                                                        '\"' + str(name[0]) + '\" is not a branch.')
+                raise PyOptionTreeRetrievalError(b.__LocString(action='Retrieving Value'),
+                                                 '\"' + str(name[i]) + '\" is not a branch.')
 
     def __RetrieveLocalValue(self, namekey, default=None, required=True,
                              vardict={}, recursionsleft=OPTTREE_MAXRECURSIONDEPTH, readyvalue=True):
@@ -1562,7 +2609,7 @@ class PyOptionTree:
             
             for idx in xrange(1, len(namekey)):
                 n = namekey[idx]
-                if type(v) == list or type(v) == tuple:
+                if type(v) == list or type(v) == tuple or isinstance(v, OTOuterProduct):
                     n = self.__ReadyValue(n, vardict=vardict, recursionsleft = recursionsleft)
                     
                     if type(n) == int:
@@ -1626,18 +2673,360 @@ class PyOptionTree:
                         return default
                 else:
                     return self.__parent
-            elif namekey in self.__opts:
+            elif namekey in self.__opts or (self.__cow != None and self.__CopyEntry(namekey)):
+                if self.__resolving:
+                    self.__RecordRead(namekey)
                 if readyvalue:
                     return self.__ReadyValue(self.__opts[namekey][0], default, required, vardict, recursionsleft)
                 else:
                     return self.__opts[namekey][0]
             else:
+                if self.__resolving:
+                    self.__RecordRead(namekey)
                 if required:
                     raise PyOptionTreeRetrievalError(self.__LocString(action='Retrieving Value'),
                                                      'Key \"' + namekey + '\" does not exist.')
                 else:
                     return default
 
+    ######################################################################
+    # The resolution cache.  Each branch keeps the values got from it
+    # in __resolved, and each key the keys of the values depending on
+    # it in __dependents; setting a key drops those values.
+
+    def __ResolveCached(self, name, required):
+        # Returns the value of name, from the cache if it's there.  If
+        # it can't be resolved, raises the error if required and
+        # otherwise returns OPTTREE_NONNONEXISTANTQUERY.
+
+        if name in self.__resolved:
+            v, deps, ok = self.__resolved[name]
+            if self.__resolving:
+                self.__resolving[-1].keys.update(deps)
+
+            if ok:
+                return self.__CopyContainers(v)
+            elif required:
+                return self.__GetValue(name)     # Raises the error again
+            else:
+                return OPTTREE_NONNONEXISTANTQUERY
+
+        rec = OTDependencies()
+        self.__resolving.append(rec)
+        try:
+            try:
+                v, ok = self.__GetValue(name), True
+            except PyOptionTreeException, ote:
+                v, ok = ote, False
+        finally:
+            self.__resolving.pop()
+
+        if self.__resolving:
+            self.__resolving[-1].keys.update(rec.keys)
+
+        # Anything that changed the tree while it was being resolved
+        # may have changed what it depends on, so it's not kept; nor
+        # is a value every caller can't be handed
+        if not rec.modified and (not ok or self.__Shareable(v)):
+            self.__KeepResolved(name, (None, v)[ok], rec.keys, ok)
+
+        if ok:
+            return self.__CopyContainers(v)
+        elif required:
+            raise v
+        else:
+            return OPTTREE_NONNONEXISTANTQUERY
+
+    def __KeepResolved(self, name, v, deps, ok):
+        self.__resolved[name] = (v, deps, ok)
+        for b, k in deps.itervalues():
+            b.__dependents.setdefault(k, {})[(id(self), name)] = (self, name)
+
+    def __GetUnderBranches(self, name, branches):
+        # For getMany(); resolves name from the branch holding it,
+        # found with __BranchAt, and caches it here with what each
+        # step depended on.  Returns OPTTREE_NONNONEXISTANTQUERY if
+        # that fails, so get() can say why or give the default.
+        if name in self.__resolved:
+            return self.__ResolveCached(name, False)
+        
+        try:
+            path = self.__Name2NameList(name)
+        except PyOptionTreeException:
+            return OPTTREE_NONNONEXISTANTQUERY
+
+        if len(path) <= 1:
+            return self.__ResolveCached(name, False)
+        elif path[-1] == '/' or path[-1] == '..':
+            return OPTTREE_NONNONEXISTANTQUERY
+
+        b, deps = self.__BranchAt(path[:-1], branches)
+        if b == None:
+            return OPTTREE_NONNONEXISTANTQUERY
+
+        key = self.__NameList2Name([path[-1]])
+        v = b.__ResolveCached(key, False)
+
+        if deps != None and v is not OPTTREE_NONNONEXISTANTQUERY and key in b.__resolved:
+            deps = deps.copy()
+            deps.update(b.__resolved[key][1])
+            self.__KeepResolved(name, b.__resolved[key][0], deps, True)
+        return v
+
+    def __BranchAt(self, path, branches):
+        # The branch at path, a list from __Name2NameList, and the keys
+        # it depends on, or (None, None) if it isn't a branch; deps is
+        # None if they aren't known.  branches holds those found so far.
+        key = tuple(path)
+
+        if key not in branches:
+            if path == []:
+                b, deps = self, {}
+            else:
+                b, deps = self.__BranchAt(path[:-1], branches)
+                if b == None:
+                    pass
+                elif path[-1] == '/':
+                    b = b.root()
+                elif path[-1] == '..':
+                    b = b.__parent
+                else:
+                    n = self.__NameList2Name([path[-1]])
+                    b, pb = b.__ResolveCached(n, False), b
+                    if deps != None and n in pb.__resolved:
+                        deps = deps.copy()
+                        deps.update(pb.__resolved[n][1])
+                    else:
+                        deps = None
+
+            branches[key] = ((None, None), (b, deps))[isinstance(b, PyOptionTree)]
+
+        return branches[key]
+
+    def __CopyContainers(self, v):
+        # Copies the lists, tuples, and dictionaries in v, as
+        # __ReadyValue builds new ones each time
+        if type(v) == list or type(v) == tuple:
+            l = list(v)
+            for i, e in enumerate(l):
+                if type(e) == list or type(e) == tuple or type(e) == dict:
+                    l[i] = self.__CopyContainers(e)
+            return (l, tuple(l))[type(v) == tuple]
+        elif type(v) == dict:
+            return dict([(k, self.__CopyContainers(e)) for k, e in v.iteritems()])
+        else:
+            return v
+
+    def __Shareable(self, v):
+        # True if v can be kept in the cache: once copied by
+        # __CopyContainers, changing what one get() returned doesn't
+        # change what another does.  Branches and outer products are
+        # the same objects get() always returns.
+        if v is None or isinstance(v, (int, long, float, complex, basestring, frozenset,
+                                       PyOptionTree, OTOuterProduct)):
+            return True
+        elif type(v) == list or type(v) == tuple:
+            for e in v:
+                if not self.__Shareable(e):
+                    return False
+            return True
+        elif type(v) == dict:
+            for e in v.itervalues():
+                if not self.__Shareable(e):
+                    return False
+            return True
+        else:
+            return False
+
+    def __RecordRead(self, key):
+        # Notes that the values being resolved depend on key, or on
+        # the whole branch if key is None
+        self.__resolving[-1].keys[(id(self), key)] = (self, key)
+
+    def __Invalidate(self, name):
+        # Drops the cached values depending on name.  Those kept under
+        # a link, its target, may have values depending on them in
+        # turn, which are dropped too.
+        todo = [(self, name), (self, None)]
+        while todo != []:
+            b, key = todo.pop()
+            if key in b.__dependents:
+                for db, n in b.__dependents.pop(key).itervalues():
+                    db.__resolved.pop(n, None)
+                    if isinstance(n, OTSoftLink):
+                        todo.append((db, n))
+
+        for rec in self.__resolving:
+            rec.modified = True
+
+    ######################################################################
+    # Constant folding
+
+    def __FoldBranch(self, visited):
+        # The branches are folded in turn from a stack
+        visited[id(self)] = True
+        n = 0
+
+        stack = [self]
+        while stack != []:
+            b = stack.pop()
+            b.__CopyEntries()
+            branches = []
+            for k, v, r in sorted([(k, v, r) for k, (v, r) in b.__opts.items()], key=itemgetter(2)):
+                if isinstance(v, PyOptionTree):
+                    if v.__parent is b and id(v) not in visited:
+                        visited[id(v)] = True
+                        branches.append(v)
+                else:
+                    fv, nf = b.__Fold(v)
+                    if nf != 0:
+                        b.__SetValue(k, fv, r)
+                        n += nf
+            branches.reverse()
+            stack += branches
+        return n
+
+    def __Fold(self, v):
+        # Returns v with the constant statements and functions in it
+        # replaced by their values, and how many were replaced
+        if type(v) == list or type(v) == tuple:
+            l, n = [], 0
+            for e in v:
+                fe, nf = self.__Fold(e)
+                l.append(fe)
+                n += nf
+            return ((l, tuple(l))[type(v) == tuple], v)[n == 0], n
+        elif isinstance(v, OTEvalStatement) or isinstance(v, OTFunctionEval):
+            if self.__IsConstant(v, {}):
+                try:
+                    return self.__ReadyValue(v), 1
+                except Exception:
+                    # Left as it is; the error comes up when it's retrieved
+                    return v, 0
+            elif isinstance(v, OTFunctionEval):
+                # A new call is made rather than changing v, which lazy
+                # copies of the branch may still share
+                rl, n = v.branch.__Fold(v.rawvaluelist)
+                if n != 0:
+                    v = OTFunctionEval(v.branch, v.funcinfo, v.loc, rl, v.name)
+                return v, n
+
+        return v, 0
+
+    def __IsConstant(self, v, inprogress):
+        # True if v, resolved in this branch, is built from constants;
+        # inprogress holds the links being followed, to stop at cycles
+        if v is None or isinstance(v, (int, long, float, basestring)):
+            return True
+        elif type(v) == list or type(v) == tuple:
+            for e in v:
+                if not self.__IsConstant(e, inprogress):
+                    return False
+            return True
+        elif type(v) == dict:
+            return self.__IsConstant(v.items(), inprogress)
+        elif isinstance(v, OTSoftLink):
+            return self.__IsConstantLink(v, inprogress)
+        elif isinstance(v, OTEvalStatement):
+            try:
+                code = (v.code, compile(v.string.lstrip(' \t'), '<string>', 'eval'))[v.code == None]
+            except SyntaxError:
+                return False
+
+            # Any other name could come from a vardict, and code inside
+            # (e.g. a lambda) isn't looked into
+            for c in code.co_consts:
+                if type(c) == type(code):
+                    return False
+            for name in code.co_names:
+                if name not in v.sldict and name not in ('True', 'False', 'None'):
+                    return False
+
+            return self.__IsConstant(v.sldict.values(), inprogress)
+        elif isinstance(v, OTFunctionEval):
+            if not v.funcinfo.pure or not v.branch.__IsConstant(v.rawvaluelist, inprogress):
+                return False
+
+            if v.funcinfo.name == 'rep' and not v.funcinfo.isuserfunc:
+                # rep() also looks up the $() and ${} variables in its strings
+                try:
+                    strings = v.branch.__ReadyValue(v.rawvaluelist)
+                except Exception:
+                    return False
+
+                while strings != []:
+                    s = strings.pop()
+                    if type(s) == list:
+                        strings += s
+                    elif isinstance(s, basestring):
+                        try:
+                            pairs = self.__FindPairs(s, None, '$(', ')') + self.__FindPairs(s, None, '${', '}')
+                        except PyOptionTreeException:
+                            return False
+                        for p in pairs:
+                            if not v.branch.__IsConstantLink(OTSoftLink(s[p[1]:p[2]], None, None), inprogress):
+                                return False
+            return True
+        else:
+            return False
+
+    def __IsConstantLink(self, link, inprogress):
+        # Only links straight to a key are followed, not to an element
+        try:
+            path = self.__LinkPath(link)
+        except PyOptionTreeException:
+            return False
+        
+        if path == [] or type(path[-1]) == tuple or path[-1] == '/' or path[-1] == '..':
+            return False
+
+        b = self
+        for n in path[:-1]:
+            if n == '/':
+                b = b.root()
+            else:
+                b = b.__GetValue([n], default=None, required=False)
+            if not isinstance(b, PyOptionTree):
+                return False
+
+        if not b.__HasKey(path[-1]) or (id(b), path[-1]) in inprogress:
+            return False
+
+        inprogress[(id(b), path[-1])] = True
+        try:
+            return b.__IsConstant(b.__opts[path[-1]][0], inprogress)
+        finally:
+            del inprogress[(id(b), path[-1])]
+
+    ######################################################################
+    # Freezing
+
+    def __Freeze(self, v, frozen, todo):
+        # frozen holds (value, struct) by id of what's been frozen so
+        # far; branches reached more than once, e.g. through a link
+        # back up the tree, are frozen once.  The value is kept so
+        # its id isn't reused while freezing.  A branch's struct is
+        # returned empty, and (branch, struct) added to todo to be
+        # filled in, so deep trees aren't frozen by recursing.
+        if isinstance(v, PyOptionTree):
+            if id(v) in frozen:
+                return frozen[id(v)][1]
+            fs = PyOptionStruct()
+            frozen[id(v)] = (v, fs)
+            todo.append((v, fs))
+            return fs
+        elif type(v) == list or type(v) == tuple or isinstance(v, OTOuterProduct):
+            return tuple([self.__Freeze(e, frozen, todo) for e in v])
+        elif type(v) == dict:
+            if id(v) in frozen:
+                return frozen[id(v)][1]
+            fs = PyOptionStruct()
+            frozen[id(v)] = (v, fs)
+            dict.update(fs, [(k, self.__Freeze(e, frozen, todo)) for k, e in v.items()])
+            return fs
+        else:
+            return v
+
     ######################################################################
     # Functions for preparing a value; i.e. following softlinks, evaluating statements, etc.
     
@@ -1676,9 +3065,9 @@ class PyOptionTree:
         elif isinstance(v, OTSoftLink):
             try:
                 if required:
-                    return self.get(v.string, vardict=vardict, recursionsleft=recursionsleft-1)
+                    return self.__FollowLink(v, vardict=vardict, recursionsleft=recursionsleft-1)
                 else:
-                    return self.get(v.string, default, vardict=vardict, recursionsleft=recursionsleft-1)
+                    return self.__FollowLink(v, default, vardict=vardict, recursionsleft=recursionsleft-1)
 
             except PyOptionTreeException, ote:
                 if required:
@@ -1705,15 +3094,181 @@ class PyOptionTree:
             return v
         
 
+    def __FollowLink(self, link, default=OPTTREE_NONNONEXISTANTQUERY, vardict={},
+                     recursionsleft=OPTTREE_MAXRECURSIONDEPTH):
+        # Same as get(link.string, ...), but with the path kept on the link
+
+        required = (default == OPTTREE_NONNONEXISTANTQUERY)
+
+        if recursionsleft <= 0:
+            raise PyOptionTreeRetrievalError(self.__LocString(), 'Maximum Recursion Depth Exceeded.')
+
+        try:
+            # Chains of links are followed to their end here, so the
+            # whole chain takes one level of recursion
+            if not vardict:
+                target = self.__LinkTarget(link, recursionsleft)
+                if target != None:
+                    try:
+                        return target[0].__RetrieveLocalValue(target[1], default, required, vardict, recursionsleft)
+                    except PyOptionTreeException, ote:
+                        raise self.__PrependLinkChain(ote, link)
+
+            return self.__GetValue(self.__LinkPath(link), default, required, vardict, recursionsleft)
+        except PyOptionTreeException, ote:
+            if required:
+                raise ote.PrependMessage(self.__LocString(action='Resolving key \"' + link.string + '\"'))
+            else:
+                return default
+
+    def __LinkPath(self, link):
+        if link.path == None:
+            link.path = self.__Name2NameList(link.string)
+        return link.path
+
+    def __LinkTarget(self, link, recursionsleft=OPTTREE_MAXRECURSIONDEPTH):
+        # Returns (branch, key) for the key link leads to, following
+        # any links stored under the keys on the way, or None if a
+        # branch on the way isn't one; the key may not exist, or may
+        # be indexed.  The target of each link followed is kept in
+        # __resolved, under the link, until one of the keys read to
+        # find it changes.  Raises an error if the links form a cycle,
+        # or if resolving a branch on the way does.
+
+        chain = []          # (branch, link, keys read) for each step
+        seen = {}
+        names = []
+        b, l = self, link
+
+        while True:
+            if l in b.__resolved:
+                target, taildeps = b.__resolved[l][0], {(id(b), l) : (b, l)}
+                break
+
+            rec = OTDependencies()
+            passed = []
+            self.__resolving.append(rec)
+            try:
+                step = b.__LinkStep(l, recursionsleft, passed)
+            finally:
+                self.__resolving.pop()
+
+            # The branches passed on the way count as visited too
+            for pb, n in passed:
+                seen.setdefault((id(pb), n), len(names))
+
+            if step == None:
+                if self.__resolving:
+                    self.__resolving[-1].keys.update(rec.keys)
+                for cb, cl, crec in chain:
+                    if self.__resolving:
+                        self.__resolving[-1].keys.update(crec.keys)
+                return None
+
+            nb, key, nl = step
+            chain.append((b, l, rec))
+
+            if nl == None:
+                target, taildeps = (nb, key), {}
+                break
+
+            names.append(nb.__NameList2Name(list(nb.__path) + [key]))
+            if (id(nb), key) in seen:
+                raise PyOptionTreeRetrievalError(self.__LocString(action='Following Soft Links'),
+                                                 'Soft links form a cycle: ' + ' -> '.join(names[seen[(id(nb), key)]:]))
+            seen[(id(nb), key)] = len(names) - 1
+            b, l = nb, nl
+
+        # Each link's target depends on the keys read to find the next
+        # step and on the target kept for the next link, so following
+        # the chain again is one lookup however long it is
+        deps = taildeps
+        keep = True
+        for cb, cl, crec in reversed(chain):
+            crec.keys.update(deps)
+            keep = keep and not crec.modified
+            if keep:
+                cb.__KeepResolved(cl, target, crec.keys, True)
+                deps = {(id(cb), cl) : (cb, cl)}
+            else:
+                deps = crec.keys
+
+        if self.__resolving:
+            self.__resolving[-1].keys.update(deps)
+
+        return target
+
+    def __LinkStep(self, link, recursionsleft=OPTTREE_MAXRECURSIONDEPTH, passed=None):
+        # One step of __LinkTarget: returns the branch link leads to,
+        # the key in it, and the link stored under that key or None,
+        # or returns None if what's on the way isn't a branch.  The
+        # (branch, name) of each step on the way is added to passed.
+        # An error resolving a step is raised, as trying again through
+        # __GetValue would resolve it again at every level of a cycle.
+        path = self.__LinkPath(link)
+        b = self
+        for n in path[:-1]:
+            if n == '/':
+                b = b.root()
+            else:
+                if passed != None:
+                    passed.append((b, n))
+                b = b.__RetrieveLocalValue(n, recursionsleft=recursionsleft-1)
+            if not isinstance(b, PyOptionTree):
+                return None
+
+        key = path[-1]
+        if key == '/':
+            return None
+        elif type(key) == tuple or key == '..':
+            return (b, key, None)
+
+        if b.__resolving:
+            b.__RecordRead(key)
+        if b.__HasKey(key) and isinstance(b.__opts[key][0], OTSoftLink):
+            return (b, key, b.__opts[key][0])
+        else:
+            return (b, key, None)
+
+    def __PrependLinkChain(self, ote, link):
+        # Adds where each of the links after link in its chain was
+        # followed to an error resolving the chain's target, as if
+        # they had been followed one by one
+        chain = []
+        b, l = self, link
+        while True:
+            try:
+                step = b.__LinkStep(l)
+            except PyOptionTreeException:
+                break
+            if step == None or step[2] == None:
+                break
+            b, l = step[0], step[2]
+            chain.append((b, l))
+
+        for b, l in reversed(chain):
+            ote.PrependMessage(b.__LocString(action='Resolving key \"' + l.string + '\"'))
+            ote.PrependMessage(b.__LocString(l.loc, 'Resolving SoftLink to \"' + l.string + '\"', l.origsource))
+        return ote
+
     def __EvaluateStatement(self, evs, vardict, recursionsleft=OPTTREE_MAXRECURSIONDEPTH):
         # This evaluates the statement given...
 
         # First go through and retrieve the variables in the original vardict
 
+        if evs.constvars == None:
+            evs.constvars, evs.linkvars = {}, []
+            for k, e in evs.sldict.items():
+                if isinstance(e, (int, long, float, basestring)) or e is None:
+                    evs.constvars[k] = self.__ReadyValue(e)
+                else:
+                    evs.linkvars.append( (k, e) )
+
         rvars = vardict.copy()
+        rvars.update(evs.constvars)
 
         try:
-            for k, e in evs.sldict.items():
+            for k, e in evs.linkvars:
                 #self.__dbprint("k=" + str(self.__Value2Str(1,e,0)))
                 rvars[k] = self.__ReadyValue(e, vardict=vardict, recursionsleft=recursionsleft-1)
         except PyOptionTreeException, ote:
@@ -1722,7 +3277,10 @@ class PyOptionTree:
 
         try:
             #self.__dbprint('EVAL> ' + str(evs.string) + ' >< Locals = ' + str(rvars))
-            return eval(evs.string, globals(), rvars)
+            if evs.code == None:
+                # eval() strips leading blanks from a string before compiling it
+                evs.code = compile(evs.string.lstrip(' \t'), '<string>', 'eval')
+            return eval(evs.code, globals(), rvars)
         except Exception, e:
             errstring = self.__LocString(evs.loc, action = 'Evaluating Expression', source =evs.origsource)
             raise PyOptionTreeEvaluationError(errstring, str(e))
@@ -1730,16 +3288,16 @@ class PyOptionTree:
     def __FindPairs(self, s, cilist, p1, p2):
 
         ret = []
+        nestmap = self.__NestMap(s)
 
         p = 0
         while True:
-            np = s[p:].find(p1)
+            np = s.find(p1, p)
             if np == -1:
                 break
             
-            np += p
             startp = np + len(p1)
-            endp = self.__NextInstance(startp, p2, len(s), s)
+            endp = self.__NextInstance(startp, p2, len(s), s, nestmap)
 
             if endp == -1:
                 if cilist != None:
@@ -1756,25 +3314,21 @@ class PyOptionTree:
 
     def __EvaluateStoredFunction(self, sf, default=None, required=True, vardict={}, recursionsleft=OPTTREE_MAXRECURSIONDEPTH):
 
-        funcargs = inspect.getargspec(sf.funcinfo.getvalue)[0]
+        callargs = sf.funcinfo.callargs
 
-        if sf.funcinfo.isuserfunc:
+        if callargs == None:
             return self.__ReadyValue(sf.funcinfo.getvalue(*sf.branch.__ReadyValue(sf.rawvaluelist, recursionsleft = recursionsleft)))
         else:
             kwargs = {}
 
-            if 'branch' in funcargs:
-                kwargs['branch'] = sf.branch
-            if 'loc' in funcargs:
-                kwargs['loc'] = sf.loc
-            if 'rawvaluelist' in funcargs:
-                kwargs['rawvaluelist'] = sf.rawvaluelist
-            if 'valuelist' in funcargs:
-                kwargs['valuelist'] = sf.branch.__ReadyValue(sf.rawvaluelist, recursionsleft = recursionsleft)
-            if 'name' in funcargs:
-                kwargs['name'] = sf.name
-            if 'readyfunc' in funcargs:
-                kwargs['readyfunc'] = lambda v: sf.branch.__ReadyValue(v, default, required, vardict, recursionsleft)
+            for a in callargs:
+                if a == 'valuelist':
+                    kwargs[a] = sf.branch.__ReadyValue(sf.rawvaluelist, recursionsleft = recursionsleft)
+                elif a == 'readyfunc':
+                    kwargs[a] = lambda v: sf.branch.__ReadyValue(v, default, required, vardict, recursionsleft)
+                else:
+                    # The branch, loc, rawvaluelist, and name are kept in sf
+                    kwargs[a] = getattr(sf, a)
 
             return self.__ReadyValue(sf.funcinfo.getvalue(**kwargs))
     
@@ -1782,6 +3336,15 @@ class PyOptionTree:
     #  Tools for name bookkeeping
 
     def __Name2NameList(self, name):
+        # Parsed names are cached; a copy is returned as some callers
+        # change the list
+        l = self.__namecache.get(name)
+        if l == None:
+            l = self.__ParseName(name)
+            self.__namecache.add(name, l)
+        return list(l)
+
+    def __ParseName(self, name):
 
 #        brloc = name.find('[')
 #        if brloc == -1:
@@ -1805,16 +3368,17 @@ class PyOptionTree:
         else:
             pos = indexstart
             namekey = [name[:indexstart]]
+            nestmap = self.__NestMap(name)
 
             while True:
-                newpos = name[pos:].find('[')
+                newpos = name.find('[', pos)
                 
                 if newpos == -1:
                     break
                 
-                newpos += pos + 1
+                newpos += 1
 
-                endpos = self.__NextInstance(newpos, ']', len(name), name)
+                endpos = self.__NextInstance(newpos, ']', len(name), name, nestmap)
                 
                 if endpos == len(name):
                     raise PyOptionTreeRetrievalError(self.__LocString(action='Determining Name Indices'), 'Parse Error: matching \']\' not found.')
@@ -1879,150 +3443,157 @@ class PyOptionTree:
                                          + name[0] + '\'; must be alphabetic or \'_\'')
 
     #####################################################################
-    #  Routine for adding in the options
-
-    def __ParseCharList(self, chstr, cilist, source):
+    #  Routine for adding in the options.  The options are first
+    #  compiled: the statements are parsed into a list of (name,
+    #  value, (line, column)) with the values in the form described
+    #  with OTCompiledBranch above, nothing yet done to the tree.
+    #  __ExecuteStatements then sets them; the cache stores the
+    #  compiled statements, so a file loaded from it goes through the
+    #  same steps.
+
+    def __ParseCharList(self, chstr, cilist, source, r = None, nestmap = None, partial = False):
         """
-        Main routine for adding in the options.  Used internally and between trees.
+        Main routine for adding in the options.  Used internally and
+        between trees.  If given, r is the range within chstr to parse
+        and nestmap the result of __NestMap(chstr).  If partial is
+        True, a statement at the end of the range that has no value
+        yet is left alone instead of being an error; the position it
+        starts at is returned.  A source of None isn't recorded.
         """
-        
-        self.__RecordSource(source)
-        
-        #self.__dbprint('__PARSECHARLIST: STARTINGSTRING = $' + self.__TruncateErrorString(chstr) + '$')
+
+        if source != None:
+            self.__RecordSource(source)
+
+        (statements, rl) = self.__CompileChars(chstr, cilist, r, nestmap, partial)
+        self.__ExecuteStatements(statements, None)
+
+        return rl
+
+    def __CompileString(self, s, source = None):
+        # The compiled statements in s; a source that's given is
+        # recorded first, as __ParseCharList does.
+        (chstr, cilist) = self.__TranslateInput(s)
+        chstr = self.__EliminateComments(chstr, cilist)
+
+        if source != None:
+            self.__RecordSource(source)
+
+        return self.__CompileChars(chstr, cilist)[0]
+
+    def __CompileChars(self, chstr, cilist, r = None, nestmap = None, partial = False):
+        if r == None:
+            r = (0, len(chstr))
+        if nestmap == None:
+            nestmap = self.__NestMap(chstr)
 
         # Add the current parsing information to the stack
         self.__chstr += [chstr]
         self.__cilist += [cilist]
+        self.__nestmaps += [nestmap]
 
-        # Run with them
-        (rl, rr) = self.__ShrinkRange( (0, len(self.__ChS())) )
+        # Run with them, cleaning up after as we use a lot of memory
+        try:
+            return self.__CompileCharList(r, partial)
+        finally:
+            self.__chstr.pop()
+            self.__cilist.pop()
+            self.__nestmaps.pop()
+
+    def __CompileCharList(self, r, partial = False):
+        # The statements in the range r of the current buffer, and
+        # where parsing stopped
+        (rl, rr) = self.__ShrinkRange(r)
+        statements = []
         
         while True:
             p = self.__NextInstance(rl, self.__equalchar, rr)
             
             if p == rr:
-                if rl < rr:
+                if rl < rr and not partial:
                     raise PyOptionTreeParseError(self.__LocString(rl, action = 'Parsing Token'),
                                                'Token \"' + self.__TruncatedErrorString( (rl, rr) )
                                                + '\" not of form <tag> = <value>') 
                 else:
                     break
-            
+
             tagr = self.__ShrinkRange( (rl, p) )
-            #self.__dbprint('PARSECHARLIST> tag = ' +  '$' + self.__TruncateErrorString(self.__ChS()[tagr[0]:tagr[1]]) + '$')
 
             try:
                 name = self.__TidyName(self.__OriginalString(tagr))
             except PyOptionTreeException, ote:
                 raise ote.PrependMessage(self.__LocString(tagr, action = 'Parsing Name'))
-                
+
             valuer = (self.__NextNonWSPos(p+1, skipsemicolons = False), rr)
 
-            #self.__dbprint('value =    ' '$' + self.__TruncateErrorString(self.__ChS()[valuer[0]:valuer[1]]) + '$')
-            
+            if partial and valuer[0] >= rr:
+                break
+
             try:
-                # Now get the value and set it
-                #self.__dbprint('__ParseCharList name =    ' + name)         
                 namel = self.__Name2NameList(name)
-                #self.__dbprint('__ParseCharList name list =    ' + str(namel))
-                destbranch = self.__GetOrCreateBranch(namel[:-1])
                 if len(namel) == 0:
                     varname = './'
                 else:
                     varname = self.__NameList2Name(namel[-1])
-                #self.__dbprint('__ParseCharList varname =    ' + varname)
-                #self.__dbprint("IN PARSECHARLIST: self.__ChS() = " + self.__TruncateErrorString(self.__ChS()))
-                destbranch.__chstr += [self.__ChS()]
-                destbranch.__cilist += [self.__CiL()]
-                (value, endpos) = destbranch.__ParseValue(valuer, varname)
-                destbranch.__chstr.pop()
-                destbranch.__cilist.pop()
-                destbranch.__SetValue(varname, value)
+                
+                (value, endpos) = self.__CompileValue(valuer, varname)
             except PyOptionTreeException, ote:
                 raise ote.PrependMessage(self.__LocString(rl, action = 'Parsing Token ' + self.__TruncateErrorString(name)))
+
+            ci = self.__CiL()[rl]
+            statements.append( (name, value, (ci.line, ci.column)) )
             
             rl = self.__NextNonWSPos(endpos)
 
-        # Clean up unneeded memory as we use a lot of it
-        self.__chstr.pop()
-        self.__cilist.pop()
+        return (statements, rl)
 
-    def __ParseValue(self, r, name):
+    def __CompileValue(self, r, name):
         # Resolve the item
-
-        #self.__dbprint("PARSEVALUE> : self.__ChS() = $" + self.__TruncateErrorString(self.__ChS()) +"$" )
-        #self.__dbprint("PARSEVALUE> : self.__ChS()[r..] = $" + self.__TruncateErrorString(self.__ChS()[r[0]:r[1]]) + "$")
-                
         r = self.__ShrinkRange(r, skipsemicolons = False)
         if r[0] >= r[1]:
             return (None, r[1])
 
-        for t in self.__TypeList():
-            if t.Matches(self.__ChS()[r[0]:r[1]]):
+        for t in self.__TypeCandidates(self.__ChS()[r[0]]):
+            if t.Matches(self.__ChS(), r[0], r[1]):
                 rl = r[0] + t.matchlength
 
                 endpos = self.__NextInstance(rl, t.endmarker, r[1])
 
-                erroractionstr = self.__LocString(r, action = 'Parsing $' + self.__TruncateErrorString(self.__ChS()[rl:]) + '$ As ' + t.description)
+                # The error context is only turned into a string if
+                # needed; keep what it refers to as it is now
+                chstr, cilist, source = self.__ChS(), self.__CiL(), self.__CurSource()
+                errorstring = lambda: self.__TruncateErrorString(self.__OriginalString((rl, len(cilist)), chstr, cilist))
+                erroraction = lambda: self.__LocString(r, action = 'Parsing $' + errorstring() + '$ As ' + t.description,
+                                                       source = source, cilist = cilist)
 
-                #self.__dbprint('PARSEVALUE> Parsing $' + self.__TruncateErrorString(self.__ChS()[rl:]) + '$ As ' + t.description)
-                
                 if endpos == r[1] and isinstance(t.endmarker, basestring) and len(t.endmarker) != 0:
-                    raise PyOptionTreeParseError(self.__LocString(action = erroractionstr),
+                    raise PyOptionTreeParseError(self.__LocString(action = erroraction()),
                                                  'Terminating \'' + t.endmarker + '\' not found.')
 
                 # Get the value
                 try:
                     if isinstance(t, OTFuncInfo):
-                        rvl = self.__Function_List(self, (rl, endpos), name=name)
-
-                        otf = OTFunctionEval(branch=self, funcinfo=t, loc = self.__MakeLocTag((rl, endpos)),
-                                             rawvaluelist = rvl, name=name)
-
-                        if t.evalimmediately:
-                            v = self.__ReadyValue(otf)
-                        else:
-                            v = otf
+                        v = OTCompiledFunction(t.name, self.__CompiledLocTag((rl, endpos)),
+                                               self.__Compile_List(self, (rl, endpos), name))
+                    elif t.passname:
+                        v = t.getvalue(self, (rl, endpos), name=name)
                     else:
-                        if t.passname:
-                            v = t.getvalue(self, (rl, endpos), name=name)
-                        else:
-                            v = t.getvalue(self, (rl, endpos))
+                        v = t.getvalue(self, (rl, endpos))
                     
                 except PyOptionTreeException, ote:
-                    raise ote.PrependMessage(self.__LocString( (rl, endpos), action = erroractionstr))
+                    raise ote.PrependMessage(self.__LocString( (rl, endpos), action = erroraction()))
+
+                if isinstance(v, (OTCompiledBranch, OTCompiledFunction)):
+                    ci, vci = self.__CiL()[rl], self.__CiL()[r[0]]
+                    v.context = ((ci.line, ci.column), (vci.line, vci.column), errorstring(), t.description)
 
                 return (v, endpos + self.__Len(t.endmarker))
 
         # Nothing matches, so...
         raise PyOptionTreeParseError(self.__LocString(r, action = 'Parsing Value'),
                                    'Type not recognized: \"'
-                                   + self.__TruncateErrorString(self.__ChS()[r[0]:]) + '\"')
-
-    ######################################################################
-    # Parsing the various things 
+                                   + self.__TruncatedErrorString( (r[0], self.__ChEnd()) ) + '\"')
 
-    ####################
-    # Numeric
-    def __Function_Number(self, branch, r):
-        r = branch.__ShrinkRange(r);
-        s = branch.__OriginalString(r);
-        try:
-            if s.find('.') != -1:
-                return float(s)
-            else:
-                return int(s)
-        except ValueError:
-            raise PyOptionTreeParseError(branch.__LocString(r, action = 'Parsing Number'),
-                                         'Unable to convert \"' + s + '\" to a numeric value.')
-    ####################
-    # Strings
-    def __Function_String(self, branch, r):
-        return branch.__OriginalString(r)
-
-    ####################
-    # List
-    def __Function_List(self, branch, r, name):
+    def __Compile_List(self, branch, r, name):
         # First split up the list
         r = branch.__ShrinkRange(r)
         rl = r[0]
@@ -2030,7 +3601,7 @@ class PyOptionTree:
 
         try:
             while rl < r[1]:
-                (v, ep) = branch.__ParseValue( (rl, r[1]), name + '[' + str(len(l)) + ']')
+                (v, ep) = branch.__CompileValue( (rl, r[1]), name + '[' + str(len(l)) + ']')
                 l += [v]
                 rl = branch.__NextInstance(ep, self.__listsepchar, r[1]) + 1
                 
@@ -2039,60 +3610,141 @@ class PyOptionTree:
 
         return l
 
-    ####################
-    # Tuples
-    def __Function_Tuple(self, branch, r, name):
-        return tuple(branch.__Function_List(branch,r, name))
-
-    ####################
-    # Branch
-    def __Function_Branch(self, branch, r, name):
+    def __Compile_Tuple(self, branch, r, name):
+        return tuple(branch.__Compile_List(branch, r, name))
 
-        ot = branch.__GetOrCreateBranch(name)
-        #self.__dbprint("__FUNCTION_BRANCH: STRING = " + branch.__TruncatedErrorString(r))
-        ot.__ParseCharList(branch.__ChS()[r[0]:r[1]], branch.__CiL()[r[0]:r[1]], branch.__CurSource())
-        return ot
+    def __Compile_Branch(self, branch, r, name):
+        branch.__chstr += [branch.__ChS()]
+        branch.__cilist += [branch.__CiL()[:r[1]]]
+        branch.__nestmaps += [branch.__NM()]
+        try:
+            statements = branch.__CompileCharList(r)[0]
+        finally:
+            branch.__chstr.pop()
+            branch.__cilist.pop()
+            branch.__nestmaps.pop()
+        
+        return OTCompiledBranch(statements)
 
-    ####################
-    # Soft Link
-    def __Function_SoftLink(self, branch, r):
+    def __Compile_SoftLink(self, branch, r):
         (rl, rr) = branch.__ShrinkRange(r)
-        #print "SOFTLINK = " + branch.__TidyName(branch.__OriginalString(branch.__ChS()[rl:rr]))
-        return OTSoftLink(branch.__TidyName(branch.__OriginalString(branch.__ChS()[rl:rr])),
-                          branch.__MakeLocTag( (rl, rr) ), branch.__CurSource())
+        return OTSoftLink(branch.__TidyName(branch.__OriginalString( (rl, rr) )),
+                          branch.__CompiledLocTag( (rl, rr) ), None)
 
-    ####################
-    # Evaluation statement
-    def __Function_Eval(self, branch, r):
+    def __Compile_Eval(self, branch, r):
         (rl, rr) = branch.__ShrinkRange(r)
 
-        estr = branch.__ChS()[rl:rr]
-        elist = branch.__CiL()[rl:rr]
+        pairs = branch.__EvalPairs(rl, rr)
+
+        varlist = []
+        vnames = {}
+        
+        for p in reversed(pairs):
+            varrepname = 'VAR_' + OTRandTag()
+            varlist.append( (varrepname, branch.__CompileValue( (rl+p[1], rl+p[2]), varrepname)[0]) )
+            vnames[p] = varrepname
 
-        sl = list(estr)
+        return OTCompiledEval(branch.__EvalString(rl, rr, pairs, vnames), branch.__CompiledLocTag( (rl, rr) ),
+                              varlist, branch.__OriginalString( (rl, rr) ))
+
+    def __ExecuteStatements(self, statements, source):
+        # Sets the compiled statements in the tree; a source of None
+        # isn't recorded
+        if source != None:
+            self.__RecordSource(source)
+        
+        for name, value, loc in statements:
+            try:
+                namel = self.__Name2NameList(name)
+                destbranch = self.__GetOrCreateBranch(namel[:-1])
+                if len(namel) == 0:
+                    varname = './'
+                else:
+                    varname = self.__NameList2Name(namel[-1])
+                destbranch.__SetValue(varname, destbranch.__MakeValue(value, varname))
+            except PyOptionTreeException, ote:
+                raise ote.PrependMessage(self.__LocString(OTChInfo(*loc), action = 'Parsing Token ' + self.__TruncateErrorString(name)))
+
+    def __MakeValue(self, v, name):
+        # Turns a compiled value into the value set in the tree
+        if type(v) == list:
+            return [self.__MakeValue(e, name + '[' + str(i) + ']') for i, e in enumerate(v)]
+        elif type(v) == tuple:
+            return tuple(self.__MakeValue(list(v), name))
+        elif isinstance(v, OTSoftLink):
+            return OTSoftLink(v.string, self.__ExpandLocTag(v.loc), self.__CurSource())
+        elif isinstance(v, OTCompiledEval):
+            vdict = {}
+            for k, e in v.varlist:
+                vdict[k] = self.__MakeValue(e, k)
+            return OTEvalStatement(v.string, loc=self.__ExpandLocTag(v.loc), origsource=self.__CurSource(),
+                                   sldict=vdict, origstring=v.origstring)
+        elif not isinstance(v, (OTCompiledBranch, OTCompiledFunction)):
+            return v
 
         try:
-            pairs = branch.__FindPairs(estr, elist, '$(', ')') + branch.__FindPairs(estr, elist, '${', '}')
+            if isinstance(v, OTCompiledBranch):
+                ot = self.__GetOrCreateBranch(name)
+                ot.__ExecuteStatements(v.statements, self.__CurSource())
+                return ot
+            else:
+                t = self.__FuncInfo(v.funcname)
+                otf = OTFunctionEval(branch=self, funcinfo=t, loc = self.__ExpandLocTag(v.loc),
+                                     rawvaluelist = self.__MakeValue(v.rawvaluelist, name), name=name)
+                if t.evalimmediately:
+                    return self.__ReadyValue(otf)
+                else:
+                    return otf
         except PyOptionTreeException, ote:
-            errs = branch.__LocString(elist, action = 'Tying Variables in Evaluation Code')
-            raise ote.PrependMessage(errs)
+            if v.context == None:
+                raise
+            (loc, valueloc, errorstring, description) = v.context
+            raise ote.PrependMessage(self.__LocString(OTChInfo(*loc), action = self.__LocString(
+                OTChInfo(*valueloc), action = 'Parsing $' + errorstring + '$ As ' + description)))
+
+    ######################################################################
+    # Parsing the various things 
 
-        vdict = {}
+    ####################
+    # Numeric
+    def __Function_Number(self, branch, r):
+        r = branch.__ShrinkRange(r);
+        s = branch.__OriginalString(r);
+        try:
+            if s.find('.') != -1:
+                return float(s)
+            else:
+                return int(s)
+        except ValueError:
+            raise PyOptionTreeParseError(branch.__LocString(r, action = 'Parsing Number'),
+                                         'Unable to convert \"' + s + '\" to a numeric value.')
+    ####################
+    # Strings
+    def __Function_String(self, branch, r):
+        return branch.__OriginalString(r)
 
-        #self.__dbprint('OT_FUNCTION_EVAL> Pairlist = ' + str(pairs))
-        
-        for p in reversed(pairs):
-            varrepname = 'VAR_' + OTRandTag()
-            vdict[varrepname] = branch.__ParseValue( (rl+p[1], rl+p[2]), varrepname)[0] 
-            sl[p[0]:p[3]] = list(varrepname+' ')
-        
+    def __EvalPairs(self, rl, rr):
+        # The $() and ${} variables in the evaluation code at (rl, rr)
+        estr = self.__ChS()[rl:rr]
+        elist = self.__CiL()[rl:rr]
+
+        try:
+            return self.__FindPairs(estr, elist, '$(', ')') + self.__FindPairs(estr, elist, '${', '}')
+        except PyOptionTreeException, ote:
+            errs = self.__LocString(elist, action = 'Tying Variables in Evaluation Code')
+            raise ote.PrependMessage(errs)
+
+    def __EvalString(self, rl, rr, pairs, vnames):
+        # Put the statement back together with the variables replaced
+        sl = []
+        pos = rl
+        for p in sorted(pairs):
+            if rl + p[0] >= pos:
+                sl += [self.__OriginalString( (pos, rl + p[0]) ), vnames[p] + ' ']
+                pos = rl + p[3]
+        sl.append(self.__OriginalString( (pos, rr) ))
 
-        #self.__dbprint('OT_FUNCTION_EVAL> sl = ' + ''.join(sl))
-        return OTEvalStatement(self.__OriginalString(''.join(sl)),
-                               loc=branch.__MakeLocTag( (rl, rr) ),
-                               origsource=branch.__CurSource(),
-                               sldict=vdict,
-                               origstring=self.__OriginalString(estr))
+        return ''.join(sl)
 
     def __Function_None(self, branch, r, name):
         return None
@@ -2130,7 +3782,7 @@ class PyOptionTree:
                 
     ####################
     # List for concatenating
-    def __Function_CatList(self, valuelist, loc):
+    def __Function_CatList(self, branch, valuelist, loc):
 
         if valuelist == []:
             return None
@@ -2141,7 +3793,7 @@ class PyOptionTree:
             try:
                 tot = tot + v
             except Exception, e:
-                raise PyOptionTreeRetrievalError(self.__LocString(pos=loc, action = '+ing values'), str(e))
+                raise PyOptionTreeRetrievalError(branch.__LocString(pos=loc, action = '+ing values'), str(e))
 
         return tot
 
@@ -2157,12 +3809,14 @@ class PyOptionTree:
             if len(t) != 2 or not isinstance(t[0], basestring) or not isinstance(t[1], basestring):
                 raise PyOptionTreeParseError(branch.__LocString(action = "Importing Option File"),
                                              "Expected 2-tuple (file, name) or string, got \'" + str(t) +"\'" )
+
+        compiled = ot.__CompileFiles([f.strip() for f, n in files])
         
-        for f, n in files:
+        for (f, n), statements in zip(files, compiled):
             f, n = f.strip(), n.strip()
             
             try:
-                ot.addOptionsFile(f, sourcename=n)
+                ot.__AddCompiledFile(f, n, statements)
             except IOError, ioe:
                 errlist += ['Error Opening File \'' + n + '\': ' + str(ioe) + '\n']
             except PyOptionTreeException, ote:
@@ -2206,10 +3860,31 @@ class PyOptionTree:
         elif isinstance(v, PyOptionTree):
             ot = self.__GetOrCreateBranch(self.__Name2NameList(name))
 
-            ot.__sources = self.__sources            
-            
-            for k, e, n in sorted([(k,e,n) for k, (e,n) in v.__opts.items()], key=itemgetter(2)):
-                ot.__SetValue(k, ot.__CopyIn(v, e, k, rerefsl, depth+1))
+            # Unless there's already something in ot, or it's in v, it
+            # becomes a lazy copy of v
+            if (ot.__opts == {} and ot.__cow == None and ot.__copies == None
+                and not (ot.__root is v.__root and ot.__path[:len(v.__path)] == v.__path)):
+                if self.__resolving:
+                    v.__RecordRead(None)
+                ot.__sources = self.__sources
+                ot.__CopyLazily(v, depth+1, rerefsl, self.__sources)
+                return ot
+
+            # The branches under v are copied from a stack rather than
+            # by recursing, so deep trees can be copied
+            stack = [(ot, v, depth+1)]
+            while stack != []:
+                dst, src, d = stack.pop()
+                dst.__sources = self.__sources
+
+                if self.__resolving:
+                    src.__RecordRead(None)
+                src.__CopyEntries()
+                for k, e, n in sorted([(k,e,n) for k, (e,n) in src.__opts.items()], key=itemgetter(2)):
+                    if isinstance(e, PyOptionTree):
+                        stack.append((dst.__GetOrCreateBranch(dst.__Name2NameList(k)), e, d+1))
+                    else:
+                        dst.__SetValue(k, dst.__CopyIn(src, e, k, rerefsl, d))
             return ot
         elif isinstance(v, OTSoftLink):
             # If v points outside the tree, add prefix if reref is true,
@@ -2218,7 +3893,7 @@ class PyOptionTree:
             if srcbranch == None:
                 # Okay, don't know the src branch yet; need to resolve this til we find it
                 try:
-                    return self.__CopyIn(srcbranch, self.__GetValue(v.string, readyvalue=False),
+                    return self.__CopyIn(srcbranch, self.__GetValue(self.__LinkPath(v), readyvalue=False),
                                          name, rerefsl, depth)
                 except PyOptionTreeException, ote:
                     raise ote.PrependMessage(self.__LocString(action='In __CopyIn, srcbranch setting.'))
@@ -2227,12 +3902,12 @@ class PyOptionTree:
                 if ts[0] == '/':
                     return v 
                 else:
-                    tl = self.__Name2NameList(ts)
+                    tl = self.__LinkPath(v)
 
                     if rerefsl and len(filter(lambda e: e == '..', tl)) > depth:
                         return OTSoftLink(
-                            self.__NameList2Name(self.__CollapseNameList(['..']*(len(self.pathFromRoot())-1)
-                                                                         + srcbranch.pathFromRoot()[1:] + tl)),
+                            self.__NameList2Name(self.__CollapseNameList(['..']*self.__depth
+                                                                         + list(srcbranch.__path[1:]) + tl)),
                             v.loc, v.origsource)
                     else:
                         return v
@@ -2242,7 +3917,7 @@ class PyOptionTree:
                                    for e in v.rawvaluelist],
                                   v.name)
         elif isinstance(v, OTEvalStatement):
-            return OTEvalStatement(v.string, v.loc, v.origsource,
+            return OTEvalStatement(v.string, v.loc, v.origsource, code = v.code,
                                    sldict = dict([(k, self.__CopyIn(srcbranch, e, name, rerefsl, depth))
                                                   for k,e in v.sldict.items()]))
         else:
@@ -2251,6 +3926,99 @@ class PyOptionTree:
             except AttributeError:
                 return v
 
+    ####################
+    # Lazy copies.  A branch made a copy of another shares its entries
+    # until they're needed: each is copied over the first time it's
+    # looked at, and the ones left when the original is about to be
+    # changed are copied then.  Branches in the original become lazy
+    # copies in turn, so copying a tree takes the same time however
+    # large it is.
+
+    def __CopyLazily(self, src, depth, rerefsl, sources):
+        # Makes this empty branch a lazy copy of src; depth and rerefsl
+        # are passed on to __CopyIn() for each entry, and the branches
+        # made get sources as theirs.
+        self.__cow = (src, depth, rerefsl, sources)
+        self.__setvarrank = src.__setvarrank
+        if src.__copies == None:
+            src.__copies = weakref.WeakValueDictionary()
+        src.__copies[id(self)] = self
+
+    def __HasKey(self, key):
+        return key in self.__opts or (self.__cow != None and self.__CopyEntry(key))
+
+    def __CopyEntry(self, key):
+        # Copies key over from the original, which may itself be a lazy
+        # copy still sharing it; False if it's not there at all
+        chain = []
+        b = self
+        while key not in b.__opts:
+            if b.__cow == None:
+                return False
+            chain.append(b)
+            b = b.__cow[0]
+
+        for b in reversed(chain):
+            src, depth, rerefsl, sources = b.__cow
+            v, r = src.__opts[key]
+            if isinstance(v, PyOptionTree):
+                ot = b.__NewBranch(key)
+                ot.__sources = sources
+                ot.__CopyLazily(v, depth+1, rerefsl, sources)
+                v = ot
+            else:
+                v = b.__CopyIn(src, v, key, rerefsl, depth)
+            b.__opts[key] = (v, r)
+        return True
+
+    def __CopyEntries(self):
+        # Copies over all that's left, after which the branch no longer
+        # depends on the original
+        chain = []
+        b = self
+        while b.__cow != None:
+            chain.append(b)
+            b = b.__cow[0]
+
+        for b in reversed(chain):
+            src = b.__cow[0]
+            for key in src.__opts.keys():
+                if key not in b.__opts:
+                    b.__CopyEntry(key)
+
+            # The entries are put back in the order a full copy would
+            # have set them, those of src first, as the order of a
+            # dictionary, and so of items() and strhash(), depends on it
+            srckeys = sorted(src.__opts.keys(), key=lambda k: src.__opts[k][1])
+            ownkeys = sorted([k for k in b.__opts if k not in src.__opts],
+                             key=lambda k: b.__opts[k][1])
+            b.__opts = dict([(k, b.__opts[k]) for k in srckeys + ownkeys])
+
+            if src.__copies != None:
+                src.__copies.pop(id(b), None)
+                if len(src.__copies) == 0:
+                    src.__copies = None
+            b.__cow = None
+
+    def __SeparateCopies(self):
+        # Called before the branch is changed.  The lazy copies of it,
+        # and of the branches it's in, copy over what's left first.
+        # This is done from the root down, as the branches the copies
+        # of one level make are lazy copies of the next.  Values
+        # resolved while the copies were made are dropped too.
+        path = []
+        b = self
+        while b != None:
+            path.append(b)
+            b = b.__parent
+
+        for b in reversed(path):
+            if b.__copies != None:
+                copies, b.__copies = b.__copies, None
+                for c in copies.values():
+                    c.__CopyEntries()
+                b.__Invalidate(None)
+
     ######################################################################
     # Sequence stuff
 
@@ -2406,7 +4174,7 @@ class PyOptionTree:
             raise PyOptionTreeParseError(branch.__LocString(pos=loc, action='Unpickling String'),
                                          'All arguments must be strings, or lists of strings.')
 
-    def __Function_OuterProduct(self, branch, name, loc, rawvaluelist, valuelist):
+    def __Function_OuterProduct(self, branch, name, loc, valuelist):
         if type(valuelist) != list or len(valuelist) < 2: 
             raise PyOptionTreeParseError(branch.__LocString(pos=loc, action='Expanding Outer Product'),
                                          'Arguments must be of form (opttree, field1, field2,...)')
@@ -2425,7 +4193,8 @@ class PyOptionTree:
                 raise PyOptionTreeParseError(branch.__LocString(pos=loc, action='Expanding Outer Product'),
                                              'Argument ' + str(i+2) + ' (\'' + str(field) + '\') not a valid field in option tree (argument 1).')
 
-        # Okay, we've checked everything, now just expand out
+        # Okay, we've checked everything; the trees are made as
+        # they're asked for
 
         def ensureList(l):
             if type(l) == list:
@@ -2436,41 +4205,22 @@ class PyOptionTree:
                 return [l]
 
         fllist = filter(lambda t: len(t[1]) != 0, zip(valuelist[1:], [ensureList(ot.get(f)) for f in valuelist[1:]]))
-        fl = [n for n, v in fllist]
-        flvals = [v for n,v in fllist]
-        idxlist = [0]*len(fl)
-        idxlims = [len(fv) for fv in flvals]
-
-        def incidxlist():
-            for i in reversed(xrange(len(idxlist))):
-                if idxlist[i] + 1 < idxlims[i]:
-                    idxlist[i] += 1
-                    return False
-                else:
-                    idxlist[i] = 0
-                if i == 0:
-                    return True
-
-        def listprod(l):
-            ret = 1
-            for n in l: ret *= n
-            return ret
-
-        otret = [branch.__CopyIn(None, rawvaluelist[0], name + '[' + str(i) + ']')
-                 for i in xrange(listprod(idxlims))]
 
-        idx = 0
-        while True:
-            
-            for i in xrange(len(idxlist)):
-                otret[idx].__SetValue(fl[i], flvals[i][idxlist[i]])
+        if branch.__resolving:
+            ot.__RecordRead(None)
 
-            idx += 1
-            
-            if incidxlist():
-                break
+        return OTOuterProduct([n for n, v in fllist], [v for n, v in fllist],
+                              lambda n, combination: branch.__OuterProductItem(ot, name, n, combination))
 
-        return otret
+    def __OuterProductItem(self, template, name, n, combination):
+        # Tree n of an outer product; a lazy copy of template with the
+        # fields set
+        ot = self.__NewBranch(name + '[' + str(n) + ']')
+        ot.__sources = self.__sources
+        ot.__CopyLazily(template, 0, True, self.__sources)
+        for f, v in combination:
+            ot.set(f, v)
+        return ot
 
     def __Function_Rep(self, name, loc, branch, valuelist):
 
@@ -2508,29 +4258,98 @@ class PyOptionTree:
     ######################################################################
     # Bookkeeping functions
 
-    def __NewEscapedCharTag(self, ch):
-        tag =  OTRandTag() +'_'
-        self.__escaped_chars[tag] = ch;
-        return self.__escaped_tag_prefix + tag
+    def __TranslateInput(self, s, lineoffset = 0):
+        # Translates newline characters and escaped characters into
+        # their tags, recording where each piece of the buffer came
+        # from.  Returns the buffer and its OTLocIndex.  lineoffset is
+        # the number of lines before s in its source.
+
+        cilist = OTLocIndex()
+        cilist.lineoffset = lineoffset
+        chl = []
+        bufpos, srcpos = 0, 0
+
+        for m in self.__escapeornewline.finditer(s):
+            if m.start() > srcpos:
+                cilist.addSegment(bufpos, srcpos, False)
+                chl.append(s[srcpos:m.start()])
+                bufpos += m.start() - srcpos
+
+            if m.group() == '\n':
+                tag = self.__newlinetag
+                cilist.addSegment(bufpos, m.start(), True)
+                cilist.addLine(m.end())
+            elif len(m.group()) == 2:
+                tag = self.__escapedplaceholder
+                cilist.addSegment(bufpos, m.start() + 1, True)
+                cilist.addEscape(bufpos, m.group(1))
+            else:
+                tag = ''   # Escape character at the very end
+
+            chl.append(tag)
+            bufpos += len(tag)
+            srcpos = m.end()
+
+        if len(s) > srcpos:
+            cilist.addSegment(bufpos, srcpos, False)
+            chl.append(s[srcpos:])
+            bufpos += len(s) - srcpos
+
+        chl.append(self.__newlinetag)
+        cilist.finish(bufpos, bufpos + len(self.__newlinetag), len(s))
+
+        return (''.join(chl), cilist)
+
+    def __EliminateComments(self, chstr, cilist):
+        # Returns chstr with the comments cut out; cilist is updated
+        # to match.
+        
+        elimstack = []
+
+        # Eliminate all the comments, skipping immune nest chars
+
+        ps = 0
+        while True:
+            m = self.__skipscan.search(chstr, ps)
+            if m == None:
+                break
 
-    def __OriginalString(self, a):
-        # Translates a string back into its original form
+            ts = m.group()
+            te, cutout = self.__skiptags[ts]
+            pe = chstr.find(te, m.end())
+            if pe == -1:
+                raise PyOptionTreeParseError(self.__LocString(cilist[m.start():], action = 'Removing Comments'),
+                                             '\'' + ts + '\' missing end tag \'' + te + '\'')
+            ps = pe + len(te)
+            if cutout: elimstack += [(m.start(), ps)]
+
+        #self.__dbprint('\n\n\n\n######################### Eliminating!')
+        elimstack.sort()
+        chl = []
+        ps = 0
+        for es, ee in elimstack:
+            #self.__dbprint(chstr[es:ee])
+            chl.append(chstr[ps:es])
+            ps = ee
+        chl.append(chstr[ps:])
+
+        cilist.removeRanges(elimstack)
+
+        return ''.join(chl)
+
+    def __OriginalString(self, a, chstr = None, cilist = None):
+        # Translates a string, or a range of the buffer chstr (default
+        # __ChS()) with location index cilist, back into its original
+        # form
 
         if isinstance(a, basestring):
             s = a
         elif type(a) == tuple:
-            s = self.__ChS()[a[0]:a[1]]
-            
-        sl = s.split(self.__escaped_tag_prefix)
-        rs = sl[0]
+            if chstr == None:
+                chstr, cilist = self.__ChS(), self.__CiL()
+            s = cilist.restoreEscapes(chstr, a[0], a[1])
 
-        for ss in sl[1:]:
-            if ss[:OPTTREE_RANDALPHALENGTH+1] in self.__escaped_chars:
-                rs += self.__escaped_chars[ss[:OPTTREE_RANDALPHALENGTH+1] ] + ss[OPTTREE_RANDALPHALENGTH+1:]
-            else:
-                rs += ss
-                    
-        return rs.replace(self.__newlinetag, '\n')
+        return s.replace(self.__newlinetag, '\n')
        
     def __ShrinkRange(self, r, s = None, skipsemicolons=True):
         return (self.__NextNonWSPos(r[0], s, skipsemicolons), self.__FirstNonWSPos(r[1], s))
@@ -2539,13 +4358,16 @@ class PyOptionTree:
         
         if s == None:
             s = self.__ChS()
+            end = self.__ChEnd()
+        else:
+            end = len(s)
 
-        while rl < len(s):
+        while rl < end:
             if s[rl].isspace():
                 rl += 1
             elif skipsemicolons and s[rl] == ';':  # We want to skip over the ; on the left, these don't matter
                 rl += 1
-            elif s[rl:].startswith(self.__newlinetag):
+            elif s.startswith(self.__newlinetag, rl):
                 rl += len(self.__newlinetag)
             else:
                 break
@@ -2560,7 +4382,7 @@ class PyOptionTree:
             if s[rr-1].isspace():
                 ##self.__dbprint('Skipping back on $' + s[rr-1] + '$')
                 rr -= 1
-            elif s[:rr].endswith(self.__newlinetag):
+            elif s.endswith(self.__newlinetag, 0, rr):
                 ##self.__dbprint('Skipping back on $' + s[max(0, rr-lnlt):rr] + '$')
                 rr -= len(self.__newlinetag)
             else:
@@ -2568,40 +4390,70 @@ class PyOptionTree:
 
         return rr
 
-    def __NextInstance(self, pos, searchmarker, endpos, st = '', hasimmunity = False):
+    def __NestMap(self, st):
+        # One pass over st that records, at each position opening a
+        # nested region, the position just past its closing marker.
+        # Positions that don't open a region hold -1, and regions that
+        # are never closed end past the end of st.
+        
+        nestmap = array('i', [-1]) * len(st)
+        stack = []
+        pos = 0
+
+        while True:
+            if len(stack) != 0 and stack[-1][2]:
+                # Immune; only the closing marker counts
+                pe = st.find(stack[-1][1], pos)
+                if pe == -1:
+                    break
+                pos = pe + len(stack[-1][1])
+                nestmap[stack.pop()[0]] = pos
+                continue
+
+            m = self.__nestscan.search(st, pos)
+            if m == None:
+                break
+
+            if len(stack) != 0 and m.group() == stack[-1][1]:
+                nestmap[stack.pop()[0]] = m.end()
+            elif m.group() in self.__nestopeners:
+                r, im = self.__nestopeners[m.group()]
+                stack.append( (m.start(), r, im) )
+            pos = m.end()
+
+        for p, r, im in stack:
+            nestmap[p] = len(st) + 1
+
+        return nestmap
+
+    def __NextInstance(self, pos, searchmarker, endpos, st = '', nestmap = None):
+        # Finds the next instance of searchmarker in st, skipping over
+        # nested regions using nestmap
+        
         if st == '':
             st = self.__ChS()
+            nestmap = self.__NM()
+        elif nestmap == None:
+            nestmap = self.__NestMap(st)
 
-        searchstack = [searchmarker]
+        # Looking for the end of the region we're at the start of
+        if (pos > 0 and pos < endpos and nestmap[pos-1] != -1
+            and self.__nestopeners[st[pos-1]][0] == searchmarker):
+            return min(nestmap[pos-1] - len(searchmarker), endpos)
 
-        immunity = hasimmunity
-        
-        while pos < endpos:
-            if isinstance(searchstack[-1], basestring) and st[pos:].startswith(searchstack[-1]):
-                match = True
-                jumplength = len(searchstack[-1])
-            elif isinstance(searchstack[-1], OTSearchFunc) and searchstack[-1].matchfunc(st[pos:]):
-                match = True
-                jumplength = searchstack[-1].matchlength
-            else:
-                match = False
+        issearchfunc = isinstance(searchmarker, OTSearchFunc)
 
-            if match: 
-                if len(searchstack) == 1:
+        while pos < endpos:
+            if issearchfunc:
+                if searchmarker.matchfunc(st, pos):
                     return pos
+            elif st.startswith(searchmarker, pos):
+                return pos
 
-                searchstack.pop()
-                immunity = False
-                pos += jumplength
-            else:
-                if not immunity:
-                    for k,r,im in self.__nestchars:
-                        if st[pos:].startswith(k):
-                            searchstack.append(r)
-                            immunity = im
-                            pos += len(k) - 1 
-                            break
+            if nestmap[pos] == -1:
                 pos += 1
+            else:
+                pos = nestmap[pos]
             
         return endpos
 
@@ -2615,16 +4467,18 @@ class PyOptionTree:
 
     ######################################################################
     # Error Reporting Functions
-    def __LocString(self, pos=None, action = '', source = None):
-        # Need to translate pos to be a tuple of two indices in l
+    def __LocString(self, pos=None, action = '', source = None, cilist = None):
+        # Need to translate pos to be a tuple of two indices in l.
+        # Integer positions are looked up in cilist, or __CiL() if None.
 
         s = self.description() + ':\n\t'
 
         if type(pos) == int:
             pos = (pos, pos)
-            l = self.__CiL()
+            l = cilist
+            if l == None: l = self.__CiL()
             endflag = True
-        elif type(pos) == list and len(pos) != 0:
+        elif isinstance(pos, OTLocIndex) and len(pos) != 0:
             l = pos
             pos = (0, len(pos) - 1)
             endflag = False
@@ -2634,7 +4488,8 @@ class PyOptionTree:
                 pos = (0, 1)
                 endflag = False
             else:
-                l = self.__CiL()
+                l = cilist
+                if l == None: l = self.__CiL()
                 endflag = True
         elif isinstance(pos, OTChInfo):
             l = [pos]
@@ -2677,8 +4532,11 @@ class PyOptionTree:
         else:
             return s
 
-    def __MakeLocTag(self, r):
-        return (self.__CiL()[r[0]], self.__CiL()[max(r[0], r[1]-1)])
+    def __CompiledLocTag(self, r):
+        return tuple([(ci.line, ci.column) for ci in (self.__CiL()[r[0]], self.__CiL()[max(r[0], r[1]-1)])])
+
+    def __ExpandLocTag(self, loc):
+        return (OTChInfo(*loc[0]), OTChInfo(*loc[1]))
 
     def __RecordSource(self, sourcename):
         # The space is really important in the next line; distinguishes from <Command Line>
@@ -2711,11 +4569,40 @@ class PyOptionTree:
         else:
             return self.__cilist[-1]
 
-    def __TypeList(self):
-        if self.__types == None:
-            return self.parent().__TypeList()
+    def __ChEnd(self):
+        # End of the part of __ChS() currently being parsed
+        return len(self.__CiL())
+
+    def __NM(self):
+        if self.__nestmaps == []:
+            return self.parent().__NM()
         else:
-            return self.__types
+            return self.__nestmaps[-1]
+
+    def __TypeList(self):
+        b = self
+        while b.__types == None:
+            b = b.__parent
+        return b.__types
+
+    def __TypeCandidates(self, ch):
+        # The types, in order, that a value starting with ch could be
+        b = self
+        while b.__types == None:
+            b = b.__parent
+        return b.__typeindex.get(ch, b.__typeindexdefault)
+
+    def __FuncInfo(self, funcname):
+        # The function a value reading funcname(...) parses as
+        for t in self.__TypeList():
+            if isinstance(t, OTFuncInfo) and t.name == funcname:
+                return t
+
+    def __CacheDir(self):
+        return self.__root.__cachedir
+
+    def __ParseProcesses(self):
+        return self.__root.__parseprocesses
     
     def __dbprint(self, s):
         if OTdebug:
@@ -2736,12 +4623,27 @@ class PyOptionTree:
         else:
             s = ''
         
-        for k,v,n in sorted([(k,v,n) for k, (v,n) in self.__opts.items()], key=itemgetter(2)):
-            # use basestr to allow indentation in lists or tuples
-            basestr = '  '*level + str(k) + ' = '
-            (vs, advallinks) = self.__Value2Str(level, v,len(basestr))
-            s += basestr + vs + '\n'
-            vallinks += advallinks
+        # The branches under this one are written out from a stack,
+        # each resumed where it left off once its last branch is done
+        sl = [s]
+        stack = [(self, level, self.__SortedItems())]
+        while stack != []:
+            b, lv, items = stack[-1]
+            for k,v,n in items:
+                # use basestr to allow indentation in lists or tuples
+                basestr = '  '*lv + str(k) + ' = '
+                if isinstance(v, PyOptionTree) and v.size() != 0:
+                    sl.append(basestr + '{\n')
+                    stack.append((v, lv+1, v.__SortedItems()))
+                    break
+                (vs, advallinks) = b.__Value2Str(lv, v,len(basestr))
+                sl.append(basestr + vs + '\n')
+                vallinks += advallinks
+            else:
+                stack.pop()
+                if stack != []:
+                    sl.append('  '*(lv-1) + '}\n\n')
+        s = ''.join(sl)
 
         if level == 0:
             # Write out all the values linked to at the end of the file
@@ -2752,13 +4654,20 @@ class PyOptionTree:
             return (s, vallinks)
 
         
+    def __SortedItems(self):
+        # Iterates over (key, value, rank) in the order they were set
+        if self.__resolving:
+            self.__RecordRead(None)
+        self.__CopyEntries()
+        return iter(sorted([(k,v,n) for k, (v,n) in self.__opts.items()], key=itemgetter(2)))
+
     def __Value2Str(self, level, v, indentlength): 
         if isinstance(v, basestring):
             # Escape all the special characters
             return ('\'' + self.__OriginalString(v).replace('\\', '\\\\').replace('\'', '\\\'') + '\'', [])
         elif type(v) == float or type(v) == int:
             return (str(v), [])
-        elif type(v) == list:
+        elif type(v) == list or isinstance(v, OTOuterProduct):
             (vs, vl) = self.__List2Str(level, v, indentlength + 1) 
             return ('[' + vs + ']', vl)
         elif type(v) == tuple:
@@ -2813,12 +4722,69 @@ class PyOptionTree:
 
         return (basers + queuedrs + rs, retl + rl)
 
-## class PyOptionStruct:
-##     """
-##     This class is just a trimmed-down, optimized version of the
-##     PyOptionStruct that uses only the bare minimum to keep access
-##     fast.  It is created using the toStruct() method of the option
-##     tree, at which time all variables are realized and stored in this
-##     structure.  Thus all changes to this structure are completely
-##     local.
-##     """
+class PyOptionStruct(dict):
+    """
+    A read-only snapshot of an option tree, made by its ``freeze()``
+    method.  It's a dictionary of the names in the branch to their
+    values, so looking up a name is a dictionary lookup, with the
+    values already resolved; branches are PyOptionStructs as well.
+
+    Values can be read as items, ``s['x']``, or attributes, ``s.x``;
+    names that are also dictionary methods, such as ``items``, can only
+    be read as items.  ``s['b/x']`` and ``s.get('b/x')`` follow the
+    path through the branches; there's no parent to refer to with
+    '..', and a leading '/' is ignored.
+
+    Changing it raises a TypeError.
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, name):
+        # Called by dict when name isn't a key; it may be a path
+        if not isinstance(name, basestring) or '/' not in name:
+            raise KeyError(name)
+
+        v = self
+        try:
+            for n in name.split('/'):
+                if n != '':
+                    v = v[n]
+        except (KeyError, TypeError, IndexError):
+            raise KeyError(name)
+        return v
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __readonly(self, *args, **kwargs):
+        raise TypeError('PyOptionStruct is read-only')
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = __readonly
+    clear = pop = popitem = setdefault = update = __readonly
+
+    def __reduce__(self):
+        # The items are passed as the state, as pickle only stores the
+        # struct before its state; a branch can hold a link back to it
+        return (PyOptionStruct, (), dict(self))
+
+    def __setstate__(self, d):
+        dict.update(self, d)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return 'PyOptionStruct(' + dict.__repr__(self) + ')'
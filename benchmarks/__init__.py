@@ -0,0 +1,10 @@
+"""
+Benchmarks for PyOptionTree.
+
+generators makes synthetic option files of various shapes, and suite
+times the main operations on them and records the peak memory they
+use.  Results can be saved as a JSON baseline and later runs compared
+against it; see suite.py for usage.  locindex.py and nodesize.py are
+standalone comparisons of the memory taken by the location tracking
+done while parsing and by the objects a tree is made of.
+"""
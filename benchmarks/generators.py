@@ -0,0 +1,125 @@
+"""
+Generators for synthetic option files.  Each takes the number of
+keys to make, roughly, and returns (source, keys): the text of the
+option file and a list of names in it worth looking up with get().
+"""
+
+import random
+
+def flat(n):
+    """
+    n top level keys with a mix of numbers, strings, and short lists.
+    """
+    l, keys = [], []
+    for i in xrange(n):
+        k = 'key%d' % i
+        if i % 4 == 0:
+            l.append('%s = %d\n' % (k, i))
+        elif i % 4 == 1:
+            l.append('%s = %d.5\n' % (k, i))
+        elif i % 4 == 2:
+            l.append('%s = "value %d"\n' % (k, i))
+        else:
+            l.append('%s = [%d, "x", %d.25]\n' % (k, i, i))
+        keys.append(k)
+    return ''.join(l), keys
+
+def nested(n, depth=12, width=4):
+    """
+    Branches nested depth deep, with width keys at each level,
+    repeated until there are n keys.
+    """
+    l, keys = [], []
+    count, t = 0, 0
+    while count < n:
+        path = []
+        for d in xrange(depth):
+            b = 'b%d_%d' % (t, d)
+            path.append(b)
+            l.append('  '*d + '%s = {\n' % b)
+            for w in xrange(width):
+                l.append('  '*(d+1) + 'k%d = %d\n' % (w, count))
+                keys.append('/'.join(path + ['k%d' % w]))
+                count += 1
+        for d in reversed(xrange(depth)):
+            l.append('  '*d + '}\n')
+        t += 1
+    return ''.join(l), keys
+
+def numlists(n, length=1000):
+    """
+    Lists of length numbers, n numbers in all.
+    """
+    l, keys = [], []
+    rnd = random.Random(0)
+    for i in xrange(max(1, n // length)):
+        k = 'list%d' % i
+        l.append('%s = [%s]\n' % (k, ', '.join(['%.6f' % rnd.random() for j in xrange(length)])))
+        keys.append(k)
+    return ''.join(l), keys
+
+def links(n, chainlength=10):
+    """
+    Chains of soft links chainlength long; the keys returned are the
+    ends of the chains.  A link is ended with ';' as the newline after
+    it would be read as part of the name.
+    """
+    l, keys = [], []
+    for c in xrange(max(1, n // chainlength)):
+        l.append('c%d_0 = %d\n' % (c, c))
+        for i in xrange(1, chainlength):
+            l.append('c%d_%d = c%d_%d;\n' % (c, i, c, i-1))
+        keys.append('c%d_%d' % (c, chainlength-1))
+    return ''.join(l), keys
+
+def inheritance(n, basesize=20):
+    """
+    Branches made with copy() and reref() of a base branch, each
+    overriding a few of the base's basesize keys.
+    """
+    l = ['base = {\n']
+    for i in xrange(basesize):
+        l.append('  p%d = %d\n' % (i, i))
+    l.append('  link = p0;\n}\n')
+
+    keys = []
+    for i in xrange(max(1, n // basesize)):
+        k = 'd%d' % i
+        l.append('%s = %s(base)\n' % (k, ('copy', 'reref')[i % 2]))
+        l.append('%s/p%d = %d\n' % (k, i % basesize, -i))
+        keys += [k + '/p%d' % (i % basesize), k + '/link']
+    return ''.join(l), keys
+
+def outerproduct(n, fields=3):
+    """
+    outer_product() sweeps over fields lists, with n trees in all.
+    """
+    per = max(1, int(round(n ** (1.0 / fields))))
+    l = ['base = {\n']
+    for f in xrange(fields):
+        l.append('  f%d = [%s]\n' % (f, ', '.join([str(v) for v in xrange(per)])))
+    l.append('  fixed = "same"\n}\n')
+    l.append('sweep = outer_product(base, %s)\n' % ', '.join(['"f%d"' % f for f in xrange(fields)]))
+    return ''.join(l), ['sweep', 'sweep[%d]/f0' % (per ** fields // 2), 'sweep[-1]/fixed']
+
+def evals(n):
+    """
+    @() expressions, each using one other key.
+    """
+    l, keys = ['e0 = 0\n'], []
+    for i in xrange(1, n):
+        l.append('x%d = %d\n' % (i, i))
+        l.append('e%d = @($(x%d) * 2 + 1)\n' % (i, i))
+        keys.append('e%d' % i)
+    return ''.join(l), keys
+
+# Name -> (generator, number of keys for each size)
+shapes = {
+    'flat'         : (flat,         {'small' : 1000, 'medium' : 10000, 'large' : 100000, 'huge' : 1000000}),
+    'nested'       : (nested,       {'small' : 1000, 'medium' : 10000, 'large' : 100000, 'huge' : 1000000}),
+    'numlists'     : (numlists,     {'small' : 10000, 'medium' : 100000, 'large' : 1000000, 'huge' : 10000000}),
+    'links'        : (links,        {'small' : 1000, 'medium' : 10000, 'large' : 100000, 'huge' : 1000000}),
+    'inheritance'  : (inheritance,  {'small' : 1000, 'medium' : 10000, 'large' : 100000, 'huge' : 1000000}),
+    'outerproduct' : (outerproduct, {'small' : 125, 'medium' : 1000, 'large' : 8000, 'huge' : 64000}),
+    'evals'        : (evals,        {'small' : 1000, 'medium' : 10000, 'large' : 100000, 'huge' : 1000000}),
+    }
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Compares the memory needed to track source locations while parsing.
+Before OTLocIndex, addString() kept one OTChInfo per buffer character;
+now it keeps the line starts plus a few offsets for each line and
+escaped character.  This builds both for a generated option file and
+prints their sizes along with the time addString() takes on it.
+
+Usage: python benchmarks/locindex.py [number of lines]
+"""
+
+import sys, os, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree.pyoptiontree import PyOptionTree
+from benchmarks import nodesize
+
+def makeSource(nlines):
+    l = []
+    for i in xrange(nlines):
+        if i % 10 == 0:
+            l.append('# Section %d\n' % i)
+        l.append('key%d = "value \\"%d\\"" // trailing comment\n' % (i, i))
+    return ''.join(l)
+
+def charInfoList(chstr, li):
+    # The former representation; one record per buffer character
+    return [li[i] for i in xrange(len(chstr))]
+
+def sizeOfCharInfoList(cilist):
+    # Counted with the __dict__ OTChInfo had then, as it has since
+    # been given __slots__; see nodesize.py
+    tot = sys.getsizeof(cilist)
+    for ci in cilist:
+        tot += nodesize.dictSize(ci)
+    return tot
+
+def sizeOfLocIndex(li):
+    return sum([sys.getsizeof(a) for a in
+                (li.linestarts, li.segstarts, li.segsrc, li.segfixed, li.cutstarts, li.cutshifts,
+                 li.escpos, li.escchars)])
+
+def run(nlines):
+    s = makeSource(nlines)
+
+    chstr, li = PyOptionTree()._PyOptionTree__TranslateInput(s)
+    newsize = sizeOfLocIndex(li)
+
+    cilist = charInfoList(chstr, li)
+    oldsize = sizeOfCharInfoList(cilist)
+    del cilist
+
+    t = time.time()
+    PyOptionTree().addString(s)
+    parsetime = time.time() - t
+
+    print 'Source: %d lines, %d characters (%d in parse buffer)' % (nlines, len(s), len(chstr))
+    print '  OTChInfo per character: %12d bytes' % oldsize
+    print '  OTLocIndex:             %12d bytes  (%.1fx smaller)' % (newsize, float(oldsize) / newsize)
+    print '  addString():            %12.3f s' % parsetime
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Compares the memory taken by the objects a parsed tree is made of --
+branches, links, expressions, function calls, and the locations kept
+with them for error messages -- with what the same objects took as
+classes with a __dict__, before they were given __slots__.  Only the
+objects themselves are counted, not the values they hold, which are
+the same either way.
+
+Usage: python benchmarks/nodesize.py [number of keys]
+"""
+
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree.pyoptiontree import (PyOptionTree, OTSoftLink, OTEvalStatement,
+                                       OTFunctionEval, OTChInfo)
+from benchmarks import generators
+
+nodeclasses = [PyOptionTree, OTSoftLink, OTEvalStatement, OTFunctionEval, OTChInfo]
+
+class DictNode:
+    # Stands in for the classes as they were
+    pass
+
+def makeSource(n):
+    l = []
+    for shape in ['nested', 'links', 'evals']:
+        l.append(generators.shapes[shape][0](n)[0])
+    for i in xrange(n // 10):
+        l.append('f%d = cat(x%d, [%d])\n' % (i, i + 1, i))
+    return ''.join(l)
+
+def slotValues(obj):
+    d = {}
+    for c in type(obj).__mro__:
+        for name in c.__dict__.get('__slots__', ()):
+            if name in ('__dict__', '__weakref__'):
+                continue
+            if name.startswith('__'):
+                name = '_' + c.__name__ + name
+            if hasattr(obj, name):
+                d[name] = getattr(obj, name)
+    return d
+
+def dictSize(obj):
+    # Size of the object as an old-style instance holding the same
+    # attributes in its __dict__
+    dn = DictNode()
+    dn.__dict__.update(slotValues(obj))
+    return sys.getsizeof(dn) + sys.getsizeof(dn.__dict__)
+
+def collect(v, found):
+    # Gathers the node objects in v by class, each once
+    stack = [v]
+    while stack != []:
+        v = stack.pop()
+        if type(v) == list or type(v) == tuple:
+            stack += v
+        elif type(v) == dict:
+            stack += v.values()
+        elif isinstance(v, tuple(nodeclasses)):
+            if id(v) in found.setdefault(type(v), {}):
+                continue
+            found[type(v)][id(v)] = v
+            if isinstance(v, PyOptionTree):
+                stack += [e for e, r in v._PyOptionTree__opts.values()]
+            elif isinstance(v, OTFunctionEval):
+                stack += [v.loc, v.rawvaluelist]
+            elif isinstance(v, OTEvalStatement):
+                stack += [v.loc, v.sldict]
+            elif isinstance(v, OTSoftLink):
+                stack.append(v.loc)
+
+def run(n):
+    ot = PyOptionTree()
+    ot.addString(makeSource(n), 'nodesize')
+
+    found = {}
+    collect(ot, found)
+
+    print '%-16s %8s %10s %10s %12s' % ('class', 'count', 'dict', 'slots', 'saved')
+    totold = totnew = 0
+    for c in nodeclasses:
+        objs = found.get(c, {}).values()
+        if objs == []:
+            continue
+        old = sum([dictSize(o) for o in objs])
+        new = sum([sys.getsizeof(o) for o in objs])
+        totold += old
+        totnew += new
+        print '%-16s %8d %8.0f B %8.0f B %9.1f MB' % (c.__name__, len(objs), float(old) / len(objs),
+                                                      float(new) / len(objs), (old - new) / 1048576.0)
+    print '%-16s %8s %8.1f MB %6.1f MB %9.1f MB' % ('total', '', totold / 1048576.0, totnew / 1048576.0,
+                                                    (totold - totnew) / 1048576.0)
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
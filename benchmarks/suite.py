@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+Times parsing and the main tree operations on each of the shapes in
+generators, and records the peak memory each one takes.
+
+Usage: python -m benchmarks.suite [options]
+
+  -s, --size SIZE     small (default), medium, large, or huge
+  --shapes A,B,...    only run these shapes
+  --ops A,B,...       only run these operations
+  -r, --repeat N      run each operation N times (default 3)
+  --save FILE         save the results as a JSON baseline
+  --compare FILE      compare the results with a saved baseline
+  --threshold F       ratio above which a result is flagged as worse
+                      than the baseline (default 1.1)
+
+The operations are parse (addString), get (of the keys listed by the
+generator), items (over every branch), copy, strhash, and saveTree.
+Each shape and operation is run in a fresh process.  The times
+recorded are those of the first run and the best of all the runs.
+The peak memory is how far the process's resident size rose above
+where it was before the first run.  On Linux the peak is reset before
+the run; elsewhere it's the growth of the peak since the start of the
+process, which misses memory freed by the setup and used again.
+"""
+
+import sys, os, gc, time, json, platform, resource, subprocess, tempfile
+from optparse import OptionParser
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _root)
+
+from PyOptionTree import PyOptionTree
+from benchmarks import generators
+
+operations = ['parse', 'get', 'items', 'copy', 'strhash', 'saveTree']
+sizes = ['small', 'medium', 'large', 'huge']
+
+RESULTFORMAT = 1
+
+def maxRSS():
+    # In bytes; Linux gives kilobytes, OS X bytes
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (r*1024, r)[sys.platform == 'darwin']
+
+def procStatus(field):
+    # A size from /proc/self/status in bytes, e.g. VmRSS or VmHWM
+    f = open('/proc/self/status')
+    try:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    finally:
+        f.close()
+
+def resetPeak():
+    # Returns the resident size the peak was reset to, or None if
+    # that can't be done here
+    try:
+        f = open('/proc/self/clear_refs', 'w')
+        f.write('5')
+        f.close()
+        return procStatus('VmRSS')
+    except (IOError, TypeError):
+        return None
+
+def walkItems(ot, seen):
+    seen.add(id(ot))
+    for n, v in ot.items():
+        if isinstance(v, PyOptionTree) and id(v) not in seen:
+            walkItems(v, seen)
+
+def makeOperation(op, source, keys):
+    # Returns the function to time; any setup is done here
+    if op == 'parse':
+        return lambda: PyOptionTree().addString(source, 'benchmark')
+
+    ot = PyOptionTree()
+    ot.addString(source, 'benchmark')
+
+    if op == 'get':
+        def run():
+            for k in keys:
+                ot.get(k)
+        return run
+    elif op == 'items':
+        return lambda: walkItems(ot, set())
+    elif op == 'copy':
+        return ot.copy
+    elif op == 'strhash':
+        return ot.strhash
+    elif op == 'saveTree':
+        fd, filename = tempfile.mkstemp(suffix='.opt')
+        os.close(fd)
+        def run():
+            try:
+                ot.saveTree(filename)
+            finally:
+                os.remove(filename)
+        return run
+    else:
+        raise ValueError('Unknown operation ' + op)
+
+def runOne(shape, size, op, repeat):
+    # Run in the child process
+    generator, nkeys = generators.shapes[shape]
+    source, keys = generator(nkeys[size])
+    run = makeOperation(op, source, keys)
+
+    gc.collect()
+    reset = resetPeak()
+    before = (reset, maxRSS())[reset == None]
+
+    t = time.time()
+    run()
+    times = [time.time() - t]
+
+    if reset != None:
+        peakmem = procStatus('VmHWM') - before
+    else:
+        peakmem = maxRSS() - before
+
+    for i in xrange(repeat - 1):
+        t = time.time()
+        run()
+        times.append(time.time() - t)
+
+    return {'first' : times[0], 'best' : min(times), 'peakmem' : peakmem}
+
+def runAll(size, shapes, ops, repeat):
+    results = {}
+    for shape in shapes:
+        results[shape] = {}
+        for op in ops:
+            p = subprocess.Popen([sys.executable, '-m', 'benchmarks.suite', '--child',
+                                  shape, size, op, str(repeat)],
+                                 cwd=_root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, err = p.communicate()
+            if p.returncode == 0:
+                r = json.loads(out.strip().splitlines()[-1])
+            else:
+                r = {'error' : (err.strip().splitlines() or ['exit code %d' % p.returncode])[-1]}
+            results[shape][op] = r
+            printResult(shape, op, r)
+    return results
+
+def printResult(shape, op, r, base=None, threshold=None):
+    if 'error' in r:
+        print '%-13s %-9s  failed: %s' % (shape, op, r['error'])
+        return
+
+    line = '%-13s %-9s %10.4f s %10.4f s %10.1f MB' % (shape, op, r['first'], r['best'], r['peakmem'] / 1048576.0)
+
+    if base != None and 'error' not in base:
+        tr = r['best'] / max(base['best'], 1e-9)
+        mr = float(r['peakmem'] + 1) / (base['peakmem'] + 1)
+        line += '   time x%.2f%s   mem x%.2f%s' % (tr, ('', ' !')[tr > threshold],
+                                                 mr, ('', ' !')[mr > threshold])
+    print line
+
+def compare(results, baseline, threshold):
+    print
+    print 'Compared with baseline from %s (size %s, Python %s):' % (baseline['date'], baseline['size'],
+                                                                  baseline['python'])
+    worse = 0
+    for shape in sorted(results):
+        for op in operations:
+            if op not in results[shape]:
+                continue
+            base = baseline['results'].get(shape, {}).get(op)
+            printResult(shape, op, results[shape][op], base, threshold)
+            if base != None and 'error' not in base and 'error' not in results[shape][op]:
+                if results[shape][op]['best'] > threshold * base['best']:
+                    worse += 1
+    print
+    print '%d result(s) slower than the baseline by more than x%.2f' % (worse, threshold)
+
+def main(argv):
+    if len(argv) == 5 and argv[0] == '--child':
+        print json.dumps(runOne(argv[1], argv[2], argv[3], int(argv[4])))
+        return 0
+
+    parser = OptionParser(usage='python -m benchmarks.suite [options]')
+    parser.add_option('-s', '--size', default='small', choices=sizes)
+    parser.add_option('--shapes', default=','.join(sorted(generators.shapes)))
+    parser.add_option('--ops', default=','.join(operations))
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    parser.add_option('--save', metavar='FILE')
+    parser.add_option('--compare', metavar='FILE')
+    parser.add_option('--threshold', type='float', default=1.1)
+    options, args = parser.parse_args(argv)
+
+    shapes = options.shapes.split(',')
+    ops = options.ops.split(',')
+    for s in shapes:
+        if s not in generators.shapes:
+            parser.error('Unknown shape ' + s)
+    for op in ops:
+        if op not in operations:
+            parser.error('Unknown operation ' + op)
+
+    print '%-13s %-9s %12s %12s %13s' % ('shape', 'operation', 'first', 'best', 'peak memory')
+    results = runAll(options.size, shapes, ops, options.repeat)
+
+    if options.save:
+        f = open(options.save, 'w')
+        json.dump({'format' : RESULTFORMAT,
+                   'size' : options.size,
+                   'repeat' : options.repeat,
+                   'python' : platform.python_version(),
+                   'platform' : platform.platform(),
+                   'date' : time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'results' : results}, f, indent=1, sort_keys=True)
+        f.close()
+
+    if options.compare:
+        f = open(options.compare)
+        baseline = json.load(f)
+        f.close()
+        if baseline.get('format') != RESULTFORMAT:
+            parser.error(options.compare + ' is not a baseline saved by this suite')
+        compare(results, baseline, options.threshold)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,56 @@
+"""
+Tests for accessor(), which gives a function reading one key.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, PyOptionTreeRetrievalError
+
+class TestAccessor(unittest.TestCase):
+
+    def tree(self, s):
+        ot = PyOptionTree()
+        ot.addString(s)
+        return ot
+
+    def testValue(self):
+        ot = self.tree('m = {o = {lr = 0.1;}}\nlr = m/o/lr;\n')
+        lr = ot.accessor('m/o/lr')
+        self.assertEqual(lr(), 0.1)
+        self.assertEqual(lr(), ot.get('m/o/lr'))
+        self.assertEqual(ot.accessor('lr')(), 0.1)
+
+    def testSet(self):
+        ot = self.tree('m = {o = {lr = 0.1;}}\nlr = m/o/lr;\n')
+        lr, link = ot.accessor('m/o/lr'), ot.accessor('lr')
+        lr(), link()
+        ot.set('m/o/lr', 0.2)
+        self.assertEqual(lr(), 0.2)
+        self.assertEqual(link(), 0.2)
+
+    def testAddString(self):
+        ot = self.tree('m = {o = {lr = 0.1;}}\nlr = m/o/lr;\n')
+        lr, link = ot.accessor('m/o/lr'), ot.accessor('lr')
+        lr(), link()
+        ot.addString('m/o = {lr = 0.3;}\n')
+        self.assertEqual(lr(), 0.3)
+        self.assertEqual(link(), 0.3)
+
+    def testDefault(self):
+        ot = self.tree('a = 1\n')
+        x = ot.accessor('x', 5)
+        self.assertEqual(x(), 5)
+        ot.addString('x = 7\n')
+        self.assertEqual(x(), 7)
+        self.assertRaises(PyOptionTreeRetrievalError, ot.accessor('y'))
+
+    def testBadName(self):
+        ot = self.tree('a = 1\n')
+        self.assertRaises(PyOptionTreeRetrievalError, ot.accessor, 'a[1')
+
+if __name__ == '__main__':
+    unittest.main()
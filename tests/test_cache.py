@@ -0,0 +1,71 @@
+"""
+Tests for the cache of resolved values, which is dropped as the tree
+changes.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree
+
+class TestCache(unittest.TestCase):
+
+    def tree(self, s):
+        ot = PyOptionTree()
+        ot.addString(s)
+        return ot
+
+    def testSet(self):
+        ot = self.tree('a = 1\nb = {x = ../a;}\nf = @($(b/x) + 1)\n')
+        self.assertEqual(ot.get('f'), 2)
+        ot.set('a', 5)
+        self.assertEqual(ot.get('f'), 6)
+        ot.set('b/x', 7)
+        self.assertEqual(ot.get('f'), 8)
+
+    def testAddString(self):
+        ot = self.tree('a = 1\nl = a;\nf = @($(l) * 2)\n')
+        self.assertEqual(ot.get('f'), 2)
+        ot.addString('a = 3\n')
+        self.assertEqual(ot.get('f'), 6)
+        ot.addString('l = 10\n')
+        self.assertEqual(ot.get('f'), 20)
+
+    def testContainersCopied(self):
+        ot = self.tree('a = [1, [2, 3]]\nd = @({"k" : [1]})\n')
+        ot.get('a')[1].append(4)
+        ot.get('d')['k'].append(2)
+        self.assertEqual(ot.get('a'), [1, [2, 3]])
+        self.assertEqual(ot.get('d'), {'k' : [1]})
+
+    def testMutableNotShared(self):
+        ot = self.tree('s = @(set([1, 2]))\n')
+        ot.get('s').add(3)
+        self.assertEqual(ot.get('s'), set([1, 2]))
+        self.assertFalse(ot.get('s') is ot.get('s'))
+
+    def testThreads(self):
+        # What each thread reads while resolving is recorded for that
+        # thread only, so no value is kept with too few dependencies
+        stale = []
+
+        def work():
+            ot = self.tree('b = {x = ../l;}\na = 0\nf = @($(b/x) + 0)\nl = a\n')
+            for i in xrange(500):
+                ot.set('a', i)
+                if ot.get('f') != i:
+                    stale.append(i)
+
+        threads = [threading.Thread(target = work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(stale, [])
+
+if __name__ == '__main__':
+    unittest.main()
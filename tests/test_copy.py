@@ -0,0 +1,43 @@
+"""
+Tests for copies of branches, which share what's in the original
+until either is changed.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree
+
+class TestCopy(unittest.TestCase):
+
+    def tree(self, s):
+        ot = PyOptionTree()
+        ot.addString(s)
+        return ot
+
+    def testOverride(self):
+        ot = self.tree('base = {p = 1; q = 2;}\nc = copy(base)\nc/p = 10\n')
+        self.assertEqual(ot.get('c/p'), 10)
+        self.assertEqual(ot.get('c/q'), 2)
+        self.assertEqual(ot.get('base/p'), 1)
+
+    def testOriginalChanged(self):
+        ot = self.tree('base = {p = 1; b = {x = 3;}}\nc = copy(base)\n')
+        ot.set('base/b/x', 4)
+        self.assertEqual(ot.get('c/b/x'), 3)
+        self.assertEqual(ot.get('base/b/x'), 4)
+
+    def testFoldConstantsKeepsCopies(self):
+        # Folding the original's function calls mustn't change the
+        # calls a copy still shares with it
+        ot = self.tree('base = {p = 1; f = cat(@($(p)*1), @(len([3])))}\n'
+                       'c = copy(base)\nc/p = 10\n')
+        ot.foldConstants()
+        self.assertEqual(ot.get('c/f'), 11)
+        self.assertEqual(ot.get('base/f'), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Tests for trees nested deeper than the recursion limit and long
+chains of links.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree
+
+class TestDeep(unittest.TestCase):
+
+    depth = sys.getrecursionlimit() + 500
+
+    def setUp(self):
+        self.names = ['n%d' % i for i in range(self.depth)]
+        self.name = '/'.join(self.names)
+        self.ot = PyOptionTree()
+        self.ot.set(self.name + '/v', 1)
+
+    def testGet(self):
+        self.assertEqual(self.ot.get(self.name + '/v'), 1)
+
+    def testPath(self):
+        b = self.ot
+        for n in self.names:
+            b = b.get(n)
+        self.assertTrue(b.root() is self.ot)
+        self.assertEqual(b.pathFromRoot(), ['/'] + self.names)
+        self.assertEqual(b.nameFromRoot(), '/' + self.name)
+        self.assertTrue(b.description().startswith(self.ot.description()))
+        self.assertTrue(b.description().endswith('/' + self.names[-1]))
+
+    def testLinkUp(self):
+        self.ot.addString(self.name + '/w = ' + '/'.join(['..']*self.depth) + '/top;\ntop = 4\n')
+        self.assertEqual(self.ot.get(self.name + '/w'), 4)
+
+    def testCopy(self):
+        c = self.ot.copy()
+        c.set(self.name + '/v', 2)
+        self.assertEqual(c.get(self.name + '/v'), 2)
+        self.assertEqual(self.ot.get(self.name + '/v'), 1)
+
+    def testFreeze(self):
+        s = self.ot.freeze()
+        self.assertEqual(s[self.name + '/v'], 1)
+
+    def testLinkChain(self):
+        ot = PyOptionTree()
+        ot.addString('l0 = 5\n' + ''.join(['l%d = l%d;\n' % (i+1, i) for i in range(self.depth)]))
+        self.assertEqual(ot.get('l%d' % self.depth), 5)
+
+if __name__ == '__main__':
+    unittest.main()
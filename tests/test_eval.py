@@ -0,0 +1,53 @@
+"""
+Tests for @() and eval() expressions, which are compiled once and
+evaluated each time they are resolved.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, PyOptionTreeEvaluationError
+
+class TestEval(unittest.TestCase):
+
+    def tree(self, s):
+        ot = PyOptionTree()
+        ot.addString(s)
+        return ot
+
+    def testVariables(self):
+        ot = self.tree('a = 2\nl = [1, 2, 3]\nf = @($(a) * 10 + len($(l)))\nk = @(${a} * 2)\n')
+        self.assertEqual(ot.get('f'), 23)
+        self.assertEqual(ot.get('k'), 4)
+
+    def testRepeated(self):
+        # The same compiled expression gives each new value
+        ot = self.tree('a = 2\nf = @($(a) * 10)\n')
+        for i in range(5):
+            ot.set('a', i)
+            self.assertEqual(ot.get('f'), i*10)
+
+    def testVardict(self):
+        ot = self.tree('a = 2\ng = eval(x + $(a))\n')
+        vardict = {'x' : 5}
+        self.assertEqual(ot.get('g', vardict = vardict), 7)
+        self.assertEqual(ot.get('g', vardict = {'x' : 6}), 8)
+        self.assertEqual(vardict, {'x' : 5})
+        self.assertRaises(PyOptionTreeEvaluationError, ot.get, 'g')
+        self.assertEqual(ot.get('g', 'default'), 'default')
+
+    def testCopies(self):
+        ot = self.tree('base = {a = 1; f = @($(a) + 1)}\nc = copy(base)\nc/a = 10\n')
+        self.assertEqual(ot.get('base/f'), 2)
+        self.assertEqual(ot.get('c/f'), 11)
+
+    def testSyntaxError(self):
+        ot = self.tree('a = 2\nh = @($(a) +)\n')
+        self.assertRaises(PyOptionTreeEvaluationError, ot.get, 'h')
+        self.assertEqual(ot.get('a'), 2)
+
+if __name__ == '__main__':
+    unittest.main()
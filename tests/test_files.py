@@ -0,0 +1,81 @@
+"""
+Tests for reading option files, streamed or not.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest, tempfile, shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import PyOptionTree.pyoptiontree as pyoptiontree
+from PyOptionTree import PyOptionTree, PyOptionTreeException
+
+class TestFiles(unittest.TestCase):
+
+    text = '# header\n' + ''.join(['k%d = %d\n' % (i, i) for i in range(100)])
+
+    def setUp(self):
+        self.streamingsize = pyoptiontree.OPTTREE_STREAMINGFILESIZE
+        pyoptiontree.OPTTREE_STREAMINGFILESIZE = 16
+
+    def tearDown(self):
+        pyoptiontree.OPTTREE_STREAMINGFILESIZE = self.streamingsize
+
+    def testStreamed(self):
+        fd, path = tempfile.mkstemp(suffix = '.opt')
+        try:
+            os.write(fd, self.text)
+            os.close(fd)
+            f = open(path)
+            f.readline()
+            ot = PyOptionTree()
+            ot.addOptionsFile(f)
+            self.assertEqual(ot.get('k0'), 0)
+            self.assertEqual(ot.get('k99'), 99)
+        finally:
+            os.remove(path)
+
+    def testPipe(self):
+        # Pipes can't be seeked or mapped, so they are read as they are
+        r, w = os.pipe()
+        os.write(w, self.text)
+        os.close(w)
+        f = os.fdopen(r)
+        ot = PyOptionTree()
+        ot.addOptionsFile(f)
+        self.assertEqual(ot.get('k99'), 99)
+
+    def testCache(self):
+        # Streamed files don't go through the cache
+        pyoptiontree.OPTTREE_STREAMINGFILESIZE = None
+
+        cachedir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        fd, path = tempfile.mkstemp(suffix = '.opt')
+        try:
+            os.write(fd, 'a = 1\nb = {c = [../a, @(2*3), copy(../a)];}\nd = copy(b/x)\n')
+            os.close(fd)
+            
+            messages = []
+            for i in range(2):
+                ot = PyOptionTree()
+                ot.setCacheDir(cachedir)
+                try:
+                    ot.addOptionsFile(path)
+                except PyOptionTreeException, ote:
+                    messages.append(str(ote))
+                self.assertEqual(ot.get('b/c'), [1, 6, 1])
+                self.assertEqual(len(os.listdir(cachedir)), 1)
+
+            # Loaded from the cache the second time, with the same error
+            self.assertEqual(len(messages), 2)
+            self.assertEqual(messages[0], messages[1])
+            self.assertTrue('As Copy Item' in messages[1])
+        finally:
+            os.chdir(cwd)
+            os.remove(path)
+            shutil.rmtree(cachedir)
+
+if __name__ == '__main__':
+    unittest.main()
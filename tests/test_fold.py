@@ -0,0 +1,64 @@
+"""
+Tests for foldConstants(), which replaces constant expressions and
+function calls by their values.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree
+
+class TestFold(unittest.TestCase):
+
+    def tree(self, s, userfunclist = []):
+        ot = PyOptionTree(userfunclist = userfunclist)
+        ot.addString(s)
+        return ot
+
+    def testFolded(self):
+        ot = self.tree('a = 2\nl = a;\nf = @($(a) * 10)\ng = @($(l) + 1)\n'
+                       'r = range(3)\nc = cat(r, [5])\nb = {h = @($(../a) - 1)}\n')
+        self.assertEqual(ot.foldConstants(), 5)
+        self.assertEqual(ot.get('f'), 20)
+        self.assertEqual(ot.get('g'), 3)
+        self.assertEqual(ot.get('c'), [0, 1, 2, 5])
+        self.assertEqual(ot.get('b/h'), 1)
+
+        # The values are kept, so setting a afterwards doesn't change them
+        ot.set('a', 5)
+        self.assertEqual(ot.get('f'), 20)
+        self.assertEqual(ot.foldConstants(), 0)
+
+    def testNotFolded(self):
+        calls = []
+        def impure(x):
+            calls.append(x)
+            return x + 1
+
+        ot = self.tree('a = 2\nu = impure(1)\nv = eval(x + 1)\n', [('impure', impure)])
+        self.assertEqual(ot.foldConstants(), 0)
+        self.assertEqual(ot.get('u'), 2)
+        self.assertEqual(ot.get('v', vardict = {'x' : 1}), 2)
+        self.assertEqual(ot.get('v', vardict = {'x' : 2}), 3)
+        self.assertEqual(len(calls), 1)
+
+    def testPureUserFunction(self):
+        calls = []
+        def triple(x):
+            calls.append(x)
+            return 3*x
+        triple.pure = True
+
+        ot = self.tree('a = 2\nt = triple(a)\nw = triple(@($(a) + 1))\n', [('triple', triple)])
+        self.assertEqual(ot.foldConstants(), 2)
+        self.assertEqual(ot.get('t'), 6)
+        self.assertEqual(ot.get('w'), 9)
+        n = len(calls)
+        self.assertEqual(ot.get('w'), 9)
+        self.assertEqual(len(calls), n)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests for freeze() and the PyOptionStruct it returns.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest, pickle, cPickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, PyOptionStruct
+
+class TestFreeze(unittest.TestCase):
+
+    def frozen(self):
+        ot = PyOptionTree()
+        ot.addString('a = 1\nb = {x = [1, 2]; d = @({"k" : 1}); y = ../a;}\nf = @($(a) + 1)\n')
+        return ot, ot.freeze()
+
+    def testAccess(self):
+        ot, s = self.frozen()
+        self.assertTrue(isinstance(s, PyOptionStruct))
+        self.assertTrue(isinstance(s.b, PyOptionStruct))
+        self.assertEqual(s.b.x, (1, 2))
+        self.assertEqual(s['b']['x'], (1, 2))
+        self.assertEqual(s['b/x'], (1, 2))
+        self.assertEqual(s.f, 2)
+        self.assertEqual(s.b.y, 1)
+        self.assertEqual(s.b.d.k, 1)
+        self.assertEqual(sorted(s.keys()), ['a', 'b', 'f'])
+        self.assertRaises(AttributeError, getattr, s, 'q')
+        self.assertRaises(KeyError, lambda: s['q'])
+
+    def testReadOnly(self):
+        ot, s = self.frozen()
+        self.assertRaises(TypeError, setattr, s, 'a', 2)
+        self.assertRaises(TypeError, s.__setitem__, 'a', 2)
+        self.assertRaises(TypeError, delattr, s, 'a')
+        self.assertRaises(TypeError, s.update, {})
+        self.assertRaises(TypeError, s.pop, 'a')
+        self.assertRaises(TypeError, s.clear)
+
+    def testTreeChanged(self):
+        ot, s = self.frozen()
+        ot.set('a', 5)
+        self.assertEqual(s.a, 1)
+        self.assertEqual(s.b.y, 1)
+        self.assertEqual(ot.freeze().b.y, 5)
+
+    def testPickle(self):
+        ot, s = self.frozen()
+        for p in (pickle, cPickle):
+            for protocol in (0, 2):
+                u = p.loads(p.dumps(s, protocol))
+                self.assertEqual(u, s)
+                self.assertTrue(isinstance(u.b, PyOptionStruct))
+                self.assertEqual(u.b.d.k, 1)
+                self.assertRaises(TypeError, setattr, u, 'a', 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Tests for getMany(), which retrieves many keys at once.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, PyOptionTreeRetrievalError
+
+class TestGetMany(unittest.TestCase):
+
+    def tree(self, s):
+        ot = PyOptionTree()
+        ot.addString(s)
+        return ot
+
+    names = ['m/o/lr', 'm/n', 'l/b', 'x', 'm/o/b']
+
+    def testOrder(self):
+        ot = self.tree('m = {o = {lr = 0.1; b = [1, 2];} n = 3;}\nl = m/o;\nx = l/lr;\n')
+        self.assertEqual(ot.getMany(self.names), (0.1, 3, [1, 2], 0.1, [1, 2]))
+        self.assertEqual(ot.getMany(self.names), tuple([ot.get(n) for n in self.names]))
+        self.assertEqual(ot.getMany([]), ())
+
+    def testDict(self):
+        ot = self.tree('m = {o = {lr = 0.1;}}\n')
+        self.assertEqual(ot.getMany(['m/o/lr', 'q'], defaults = {'q' : 9}, asdict = True),
+                         {'m/o/lr' : 0.1, 'q' : 9})
+
+    def testMissing(self):
+        ot = self.tree('m = {o = {lr = 0.1;}}\n')
+        self.assertRaises(PyOptionTreeRetrievalError, ot.getMany, ['m/o/lr', 'q'])
+        self.assertRaises(PyOptionTreeRetrievalError, ot.getMany, ['m/o/lr/z'])
+
+    def testChanged(self):
+        ot = self.tree('m = {o = {lr = 0.1; b = [1, 2];}}\nl = m/o;\nx = l/lr;\n')
+        ot.getMany(['l/b'])[0].append(3)
+        self.assertEqual(ot.get('l/b'), [1, 2])
+        ot.set('m/o/lr', 0.5)
+        self.assertEqual(ot.getMany(['x', 'm/o/lr']), (0.5, 0.5))
+        ot.addString('m/o = {lr = 0.7;}\n')
+        self.assertEqual(ot.getMany(['x', 'l/lr']), (0.7, 0.7))
+
+if __name__ == '__main__':
+    unittest.main()
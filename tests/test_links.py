@@ -0,0 +1,43 @@
+"""
+Tests for following links, and chains and cycles of them.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, PyOptionTreeRetrievalError
+
+class TestLinks(unittest.TestCase):
+
+    def tree(self, s):
+        ot = PyOptionTree()
+        ot.addString(s)
+        return ot
+
+    def testChain(self):
+        ot = self.tree('b = {x = 2;}\nl = b;\nm = l;\na = m/x;\n')
+        self.assertEqual(ot.get('a'), 2)
+
+    def testCycle(self):
+        ot = self.tree('a = b;\nb = c;\nc = a;\n')
+        self.assertRaises(PyOptionTreeRetrievalError, ot.get, 'a')
+        self.assertEqual(ot.get('a', 'default'), 'default')
+
+    def testThroughOwnKey(self):
+        # Links and expressions going through the key being resolved
+        # give the tree's own error, not a Python RuntimeError
+        for s, default in [('t = {}\nt = t/b\n', 'default'),
+                           ('t = @($(/t/b) + 1)\n', 'default'),
+                           ('t = cat(t/b, 1)\n', 'default'),
+                           ('t = [t/b]\n', ['default']),
+                           ('a = b/x;\nb = a/y;\n', 'default')]:
+            ot = self.tree(s)
+            key = s.split()[0]
+            self.assertRaises(PyOptionTreeRetrievalError, ot.get, key)
+            self.assertEqual(ot.get(key, 'default'), default)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""
+Tests for the cache of names parsed into paths.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree.pyoptiontree import OTNameCache
+from PyOptionTree import PyOptionTree
+
+class TestNameCache(unittest.TestCase):
+
+    def testSize(self):
+        # Names used again after being moved to old still count
+        # towards the size when they are moved back
+        nc = OTNameCache(4)
+        for i in range(8):
+            nc.add(i, [i])
+        for r in range(3):
+            for i in range(8):
+                self.assertTrue(nc.get(i) in (None, [i]))
+                self.assertTrue(len(nc.recent) <= 4)
+                self.assertTrue(len(nc.old) <= 4)
+
+    def testStats(self):
+        ot = PyOptionTree()
+        ot.addString('a = {b = 1;}\n')
+        before = ot.nameCacheStats()
+        ot.get('a/b')
+        after = ot.nameCacheStats()
+        self.assertTrue(after['hits'] + after['misses'] > before['hits'] + before['misses'])
+        self.assertTrue(after['size'] <= after['maxsize'])
+
+if __name__ == '__main__':
+    unittest.main()
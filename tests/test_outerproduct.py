@@ -0,0 +1,72 @@
+"""
+Tests for outer_product(), a sequence of trees made when asked for.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, OTOuterProduct
+
+class TestOuterProduct(unittest.TestCase):
+
+    def sweep(self):
+        ot = PyOptionTree()
+        ot.addString('base = {a = [1, 2, 3]; b = [10, 20]; c = [5, 6, 7, 8]; d = 0;}\n'
+                     'sweep = outer_product(base, \'a\', \'b\', \'c\')\n')
+        return ot, ot.get('sweep')
+
+    def values(self, t):
+        return (t.get('a'), t.get('b'), t.get('c'))
+
+    def testIndexing(self):
+        ot, o = self.sweep()
+        self.assertTrue(isinstance(o, OTOuterProduct))
+        self.assertEqual(len(o), 24)
+
+        # The last field changes fastest
+        self.assertEqual([self.values(t) for t in o[:5]],
+                         [(1, 10, 5), (1, 10, 6), (1, 10, 7), (1, 10, 8), (1, 20, 5)])
+        self.assertEqual(self.values(o[-1]), (3, 20, 8))
+        self.assertEqual(o[23].get('d'), 0)
+        self.assertEqual(o.combination(5), [('a', 1), ('b', 20), ('c', 6)])
+        self.assertRaises(IndexError, o.__getitem__, 24)
+        self.assertRaises(TypeError, o.__getitem__, 'x')
+
+    def testLinks(self):
+        ot, o = self.sweep()
+        self.assertEqual(ot.get('sweep[7]/c'), 8)
+        self.assertEqual(ot.get('sweep[-1]/b'), 20)
+
+    def testSlices(self):
+        ot, o = self.sweep()
+        s = o[3:10:2]
+        self.assertEqual(len(s), 4)
+        self.assertEqual(s.combination(1), o.combination(5))
+        self.assertTrue(s[1] is o[5])
+        self.assertEqual(len(o[::5]), 5)
+
+    def testShard(self):
+        ot, o = self.sweep()
+        s = o.shard(1, 5)
+        self.assertEqual(len(s), 5)
+        self.assertEqual([t.get('c') for t in s], [6, 7, 8, 5, 6])
+        self.assertRaises(ValueError, o.shard, 5, 5)
+
+    def testLazy(self):
+        ot, o = self.sweep()
+        self.assertEqual(len(o.made), 0)
+        o[7]
+        self.assertEqual(len(o.made), 1)
+
+    def testSeparate(self):
+        ot, o = self.sweep()
+        o[4].set('a', 100)
+        self.assertEqual(o[4].get('a'), 100)
+        self.assertEqual(o[5].get('a'), 1)
+        self.assertEqual(ot.get('base/a'), [1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests for select() and --select, which keep one tree or one shard of
+an outer_product().
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, PyOptionTreeParseError, PyOptionTreeRetrievalError
+
+class TestSelect(unittest.TestCase):
+
+    text = ('base = {a = [1, 2, 3]; b = [10, 20]; c = [5, 6, 7, 8];}\n'
+            'sweep = outer_product(base, \'a\', \'b\', \'c\')\nfirst = sweep[0]\n')
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix = '.opt')
+        os.write(fd, self.text)
+        os.close(fd)
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        os.remove(self.path)
+
+    def tree(self):
+        ot = PyOptionTree()
+        ot.addString(self.text)
+        return ot
+
+    def testIndex(self):
+        ot = self.tree().select('sweep', 5)
+        o = ot.get('sweep')
+        self.assertEqual(len(o), 1)
+        self.assertEqual(o.combination(0), [('a', 1), ('b', 20), ('c', 6)])
+        self.assertEqual(o[0].treeName(), 'sweep[5]')
+        self.assertEqual(ot.get('first/c'), 6)
+        self.assertEqual(self.tree().select('sweep', -1).get('sweep')[0].treeName(), 'sweep[23]')
+
+    def testShard(self):
+        ot = self.tree().select('sweep', shard = (1, 5))
+        o = ot.get('sweep')
+        self.assertEqual([t.treeName() for t in o],
+                         ['sweep[1]', 'sweep[6]', 'sweep[11]', 'sweep[16]', 'sweep[21]'])
+        self.assertEqual([t.get('c') for t in o], [6, 7, 8, 5, 6])
+        self.assertEqual(len(o.made), 5)
+
+    def testErrors(self):
+        self.assertRaises(PyOptionTreeRetrievalError, self.tree().select, 'sweep')
+        self.assertRaises(PyOptionTreeRetrievalError, self.tree().select, 'sweep', 1, (0, 2))
+        self.assertRaises(PyOptionTreeRetrievalError, self.tree().select, 'base', 1)
+        self.assertRaises(PyOptionTreeRetrievalError, self.tree().select, 'sweep', 24)
+        self.assertRaises(PyOptionTreeRetrievalError, self.tree().select, 'sweep', shard = (5, 5))
+
+    def testCommandLine(self):
+        ot = PyOptionTree()
+        ot.addCommandLineArgs(['-f', self.path, '--select', 'sweep:5'], lookforselect = True)
+        self.assertEqual(ot.get('sweep')[0].treeName(), 'sweep[5]')
+
+        ot = PyOptionTree()
+        ot.addCommandLineArgs(['--select=sweep:1/5', '-f', self.path], lookforselect = True)
+        self.assertEqual(len(ot.get('sweep')), 5)
+
+        ot = PyOptionTree(['-f', self.path, '--select=sweep:3'], lookforselect = True)
+        self.assertEqual(ot.get('sweep')[0].treeName(), 'sweep[3]')
+
+        for spec in ('sweep', 'sweep:x', 'sweep:1/2/3'):
+            self.assertRaises(PyOptionTreeParseError, PyOptionTree().addCommandLineArgs,
+                              ['-f', self.path, '--select', spec], lookforselect = True)
+
+    def testNotLookingForSelect(self):
+        # By default --select sets an option named select
+        ot = PyOptionTree()
+        ot.addCommandLineArgs(['-f', self.path, '--select=3'])
+        self.assertEqual(len(ot.get('sweep')), 24)
+        self.assertEqual(ot.get('select'), 3)
+
+        ot = PyOptionTree(['-f', self.path, '--select=4'])
+        self.assertEqual(len(ot.get('sweep')), 24)
+        self.assertEqual(ot.get('select'), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Tests for the functions known to a tree: the built-in ones, shared by
+all trees, and the user functions added to each.
+
+Usage: python -m unittest discover tests
+"""
+
+import sys, os, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyOptionTree import PyOptionTree, PyOptionTreeParseError
+
+class TestTypes(unittest.TestCase):
+
+    def testUserFunctionsPerTree(self):
+        a = PyOptionTree(userfunclist = [('f', lambda x: x + 1)])
+        b = PyOptionTree()
+        a.addString('x = f(1)\nr = range(2)\n')
+        self.assertEqual(a.get('x'), 2)
+        self.assertEqual(a.get('r'), [0, 1])
+        self.assertRaises(PyOptionTreeParseError, b.addString, 'x = f(1)\n')
+        b.addString('r = range(3)\n')
+        self.assertEqual(b.get('r'), [0, 1, 2])
+
+    def testAddUserFunctions(self):
+        ot = PyOptionTree(userfunclist = [('f', lambda x: x + 1)])
+        ot.addUserFunctions([('f', lambda x: x * 10), ('g', lambda: 3)])
+        ot.addString('y = f(2)\nz = g()\nsub = {u = g();}\n')
+        self.assertEqual(ot.get('y'), 20)
+        self.assertEqual(ot.get('z'), 3)
+        self.assertEqual(ot.get('sub/u'), 3)
+
+    def testBuiltinsFirst(self):
+        # A user function doesn't replace a built-in one of the same name
+        ot = PyOptionTree(userfunclist = [('range', lambda x: 'mine')])
+        ot.addString('q = range(1)\n')
+        self.assertEqual(ot.get('q'), [0])
+
+    def testCopy(self):
+        ot = PyOptionTree(userfunclist = [('g', lambda: 3)])
+        c = ot.copy()
+        c.addString('w = g()\n')
+        self.assertEqual(c.get('w'), 3)
+
+if __name__ == '__main__':
+    unittest.main()